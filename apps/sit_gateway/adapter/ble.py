@@ -1,8 +1,9 @@
 # Standard Library
 import asyncio
+import json
 import logging
 import logging.config
-import struct
+import time
 
 from typing import Callable
 
@@ -10,10 +11,12 @@ from typing import Callable
 from bleak import BleakClient
 from bleak.backends.characteristic import BleakGATTCharacteristic
 from bleak.backends.device import BLEDevice
+from bleak.exc import BleakError
 
 # Library
+from apps.sit_gateway.adapter import command_codec, decoder
 from apps.sit_gateway.adapter.exceptions import BleDataException
-from apps.sit_gateway.domain.data import MsgData, SimpleMsgData
+from apps.sit_gateway.domain.data import SimpleMsgData
 
 
 LOG_CONFIG_PATH = "settings/logging.conf"
@@ -24,147 +27,240 @@ logger = logging.getLogger("pi_ble")
 
 
 class Ble:
-    def __init__(self, gateway) -> None:
+    def __init__(
+        self, gateway, link_id: int = 0, reconnect_delay: float = 2.0
+    ) -> None:
         self._gateway = gateway
+        # Passed to the notify callback instead of the device name
+        self.link_id = link_id
+        self.reconnect_delay = reconnect_delay
 
         self._client: BleakClient | None
         self._is_connected: bool = False
         self._connected_device: BLEDevice | None
         self._notify_callback: Callable
+        # Characteristics to notify on, armed again after a reconnect
+        self._notify_uuids: set[str] = set()
+        # Set once connect and service discovery finished or failed
+        self._ready = asyncio.Event()
+        self._disconnected = asyncio.Event()
+        self._closing = False
+        # One GATT write at a time per device
+        self._write_lock = asyncio.Lock()
+        # Set per device, older firmware only understands JSON
+        self.command_encoding = command_codec.JSON
+        # Send start/stop commands without waiting for the write response
+        self.write_without_response = False
 
     def _set_client(self, device: BLEDevice):
         self._client = BleakClient(device.address, self._on_disconnect)
         self._connected_device = device
 
     async def connect_device(self, device: BLEDevice):
+        """Connect and hold the link until ``cleanup``.
+
+        A link that drops after it was up is connected again and its
+        notifications are re-armed, a failed first attempt is final.
+        """
         if self._is_connected:
             return
         self._set_client(device=device)
         logger.info(f"Im Connector {device.name}: {device.address}")
-        try:
-            await self._client.connect()
-            self._is_connected = self._client.is_connected
+        while not self._closing:
+            self._disconnected.clear()
+            try:
+                await self._client.connect()
+                self._is_connected = self._client.is_connected
+                if self._is_connected:
+                    logger.info(f"Connected to {device.name}")
+                    for service in self._client.services:
+                        logger.info(f"Services: {service}")
+                        for char in service.characteristics:
+                            logger.info(f"Char: {char}")
+                    for uuid in self._notify_uuids:
+                        await self._client.start_notify(
+                            uuid, self.on_distance_notification
+                        )
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                logger.error(f"Exeption: {e}")
+            first_attempt = not self._ready.is_set()
+            self._ready.set()
             if self._is_connected:
-                logger.info(f"Connected to {device.name}")
-                for service in self._client.services:
-                    logger.info(f"Services: {service}")
-                    for char in service.characteristics:
-                        logger.info(f"Char: {char}")
-                while True:
-                    if not self._is_connected:
-                        break
-                    await asyncio.sleep(5.0)
-        except Exception as e:
-            logger.error(f"Exeption: {e}")
-            self._connected_device = None
-            self._client = None
+                await self._disconnected.wait()
+            elif first_attempt:
+                self._connected_device = None
+                self._client = None
+                return
+            if not self._closing:
+                logger.info(f"Reconnect to {device.name}")
+                await asyncio.sleep(self.reconnect_delay)
+
+    async def wait_connected(self, timeout: float = 30.0) -> bool:
+        """Wait until the connect attempt finished, True if connected."""
+        try:
+            await asyncio.wait_for(self._ready.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        return self._is_connected
 
     async def disconnect_device(self):
+        self._closing = True
         await self._client.disconnect()
         self._is_connected = False
+        self._disconnected.set()
 
     async def cleanup(self):
         if self._client is not None:
             await self.disconnect_device()
 
-    async def _on_disconnect(self, client: BleakClient):
-        logger.info(f"Disconnected from {self._connected_device.name}!")
-        self._connected_device = None
+    def _on_disconnect(self, client: BleakClient):
+        logger.info(f"Disconnected from {client.address}!")
         self._is_connected = False
         self._gateway.is_running = False
+        self._disconnected.set()
 
     async def write_command(self, uuid: str, byte_data):
         try:
-            await self._client.write_gatt_char(uuid, byte_data)
+            async with self._write_lock:
+                await self._client.write_gatt_char(uuid, byte_data)
             logger.info(f"Send {byte_data} to Periphal")
         except Exception as e:  # pylint: disable=broad-exception-caught
             logger.error(f"Exeption: {e}")
 
+    def encode_message(self, uuid: str, message: dict) -> list[bytes]:
+        """Encode a JSON command as the writes for this device.
+
+        Binary commands are split into chunks that fit into one write
+        without response, JSON is written as a whole.
+        """
+        if (
+            self.command_encoding == command_codec.BINARY
+            and message.get("type") in command_codec.MESSAGE_TYPES
+        ):
+            return command_codec.chunk(
+                command_codec.encode(message), self._write_size(uuid)
+            )
+        return [json.dumps(message).encode("utf-8")]
+
+    def _write_size(self, uuid: str) -> int:
+        characteristic = self._client.services.get_characteristic(uuid)
+        if characteristic is not None:
+            return characteristic.max_write_without_response_size
+        return self._client.mtu_size - 3
+
+    async def write_message(self, uuid: str, message: dict):
+        try:
+            writes = self.encode_message(uuid, message)
+            response = not (
+                self.write_without_response
+                and message.get("type") == "measurement_msg"
+                and all(len(data) <= self._write_size(uuid) for data in writes)
+            )
+            async with self._write_lock:
+                for data in writes:
+                    await self._client.write_gatt_char(uuid, data, response)
+            logger.info(f"Send {message['type']} to Periphal")
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            logger.error(f"Exeption: {e}")
+
+    async def write_acked(
+        self,
+        uuid: str,
+        message: dict,
+        ack_uuid: str | None = None,
+        timeout: float = 2.0,
+        retries: int = 2,
+    ) -> bool:
+        """Write and wait until the device acknowledged it.
+
+        The ATT write response is the ack, with ``ack_uuid`` the
+        characteristic is read back after the write as well. Returns
+        False when no attempt was acknowledged within ``timeout`` or the
+        message can't be written at all.
+        """
+        if self._client is None or not self._is_connected:
+            return False
+        try:
+            writes = self.encode_message(uuid, message)
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            # e.g. a field the binary command encoding doesn't know
+            logger.error(
+                f"Can't encode {message.get('type')} "
+                f"for {self.get_device_name()}: {e!r}"
+            )
+            return False
+        for attempt in range(retries + 1):
+            if self._client is None or not self._is_connected:
+                return False
+            try:
+                async with self._write_lock:
+                    for data in writes:
+                        await asyncio.wait_for(
+                            self._client.write_gatt_char(
+                                uuid, data, response=True
+                            ),
+                            timeout,
+                        )
+                    if ack_uuid is not None:
+                        await asyncio.wait_for(
+                            self._client.read_gatt_char(ack_uuid), timeout
+                        )
+                return True
+            except (BleakError, asyncio.TimeoutError) as e:
+                logger.warning(
+                    f"No ack from {self.get_device_name()}, "
+                    f"attempt {attempt + 1}: {e!r}"
+                )
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                logger.error(
+                    f"Writing to {self.get_device_name()} failed: {e!r}"
+                )
+                return False
+        return False
+
     async def get_notification(self, uuid: str, callback: Callable) -> None:
+        """Notify on ``uuid`` now if connected, else once the link is up."""
         self._notify_callback = callback
-        await self._client.start_notify(uuid, self.on_distance_notification)
+        if uuid in self._notify_uuids:
+            return
+        self._notify_uuids.add(uuid)
+        if self._is_connected:
+            await self._client.start_notify(
+                uuid, self.on_distance_notification
+            )
+
+    async def stop_notification(self, uuid: str) -> None:
+        if uuid not in self._notify_uuids:
+            return
+        self._notify_uuids.discard(uuid)
+        if self._is_connected:
+            await self._client.stop_notify(uuid)
 
     async def on_distance_notification(
         self,
         sender: BleakGATTCharacteristic,
         data: bytearray,
     ):  # pylint: disable=unused-argument
-        # Datatype 15 char[] (c string) and f->float and I->uint32_t and H->uint8_t
-        dstwr_msg_structure = "15s 15s H I I f f f f f"
-        simple_msg_sturcture = "15s I I f f f f f f f f f f f f f f f I"
-        dstwr_msg_structure_all = "15s 15s H I I f f f f f f f H H"
-        logger.debug(f"MSG Structure: {struct.calcsize(dstwr_msg_structure)}")
-        logger.debug(
-            f"All MSG Structure: {struct.calcsize(dstwr_msg_structure_all)}"
-        )
-        logger.debug(
-            f"Simple MSG Structure: {struct.calcsize(simple_msg_sturcture)}"
-        )
-        logger.debug(f"Data Lenght: {len(data)}")
+        received_at = time.monotonic()
         try:
-            if (struct.calcsize(dstwr_msg_structure)) == len(data):
-                msg_data_buf = struct.unpack(dstwr_msg_structure, data)
-                msg_data = MsgData(
-                    msg_type=msg_data_buf[0].decode("utf-8"),
-                    state=msg_data_buf[1].decode("utf-8"),
-                    responder=msg_data_buf[2],
-                    sequence=msg_data_buf[3],
-                    measurement=msg_data_buf[4],
-                    distance=msg_data_buf[5],
-                    time_round_1=msg_data_buf[6],
-                    time_round_2=msg_data_buf[7],
-                    time_reply_1=msg_data_buf[8],
-                    time_reply_2=msg_data_buf[9],
-                )
-            elif (struct.calcsize(dstwr_msg_structure_all)) == len(data):
-                msg_data_buf = struct.unpack(dstwr_msg_structure_all, data)
-                msg_data = MsgData(
-                    msg_type=msg_data_buf[0].decode("utf-8"),
-                    state=msg_data_buf[1].decode("utf-8"),
-                    responder=msg_data_buf[2],
-                    sequence=msg_data_buf[3],
-                    measurement=msg_data_buf[4],
-                    distance=msg_data_buf[5],
-                    time_round_1=msg_data_buf[6],
-                    time_round_2=msg_data_buf[7],
-                    time_reply_1=msg_data_buf[8],
-                    time_reply_2=msg_data_buf[9],
-                    nlos=msg_data_buf[13],
-                    rssi=msg_data_buf[10],
-                    fpi=msg_data_buf[11],
-                )
-            elif (struct.calcsize(simple_msg_sturcture)) == len(data):
-                msg_data_buf = struct.unpack(simple_msg_sturcture, data)
-                msg_data = SimpleMsgData(
-                    msg_type=msg_data_buf[0].decode("utf-8"),
-                    sequence=msg_data_buf[1],
-                    measurement=msg_data_buf[2],
-                    time_m21=msg_data_buf[3],
-                    time_m31=msg_data_buf[4],
-                    time_a21=msg_data_buf[5],
-                    time_a31=msg_data_buf[6],
-                    time_b21=msg_data_buf[7],
-                    time_b31=msg_data_buf[8],
-                    time_tc_i=msg_data_buf[9],
-                    time_tc_ii=msg_data_buf[10],
-                    time_tb_i=msg_data_buf[11],
-                    time_tb_ii=msg_data_buf[12],
-                    time_round_1=msg_data_buf[13],
-                    time_round_2=msg_data_buf[14],
-                    time_reply_1=msg_data_buf[15],
-                    time_reply_2=msg_data_buf[16],
-                    distance=msg_data_buf[17],
-                )
-            else:
-                raise BleDataException(f"Data length not correct: {len(data)}")
-        except struct.error as e:
+            msg_data = decoder.decode(data)
+        except BleDataException as e:
             logger.error(f"Execption - {e}")
+            return
+        if not isinstance(msg_data, SimpleMsgData):
+            msg_data.received_at = received_at
+            msg_data.decoded_at = time.monotonic()
 
-        await self._notify_callback(msg_data, self._connected_device.name)
+        await self._notify_callback(msg_data, self.link_id)
 
     def is_connected(self):
         return self._is_connected
 
+    def get_device_address(self) -> str:
+        if self._connected_device is not None:
+            return self._connected_device.address
+        return ""
+
     def get_device_name(self) -> str:
         if self._connected_device is not None:
             return self._connected_device.name
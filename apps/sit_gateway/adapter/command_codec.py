@@ -0,0 +1,121 @@
+# Standard Library
+import struct
+
+# Library
+from apps.sit_gateway.adapter.exceptions import BleDataException
+
+
+JSON = "json"
+BINARY = "binary-v1"
+
+ENCODINGS = (JSON, BINARY)
+
+MESSAGE_TYPES = {
+    "setup_msg": 1,
+    "measurement_msg": 2,
+}
+
+# Value kinds: "s" utf-8 string, "i" int32, "l" list of utf-8 strings,
+# a list repeats its tag once per item
+FIELDS = {
+    "setup_msg": {
+        "device_type": (1, "s"),
+        "initiator_device": (2, "s"),
+        "initiator": (3, "i"),
+        "responder_device": (4, "l"),
+        "responder": (5, "i"),
+        "min_measurement": (6, "i"),
+        "max_measurement": (7, "i"),
+        "measurement_type": (8, "s"),
+        "rx_ant_dly": (9, "i"),
+        "tx_ant_dly": (10, "i"),
+    },
+    "measurement_msg": {
+        "command": (1, "s"),
+    },
+}
+
+INT = struct.Struct("<i")
+
+# Chunk header: bit 7 set if more chunks follow, bits 0-6 chunk index
+MORE = 0x80
+
+
+def encode(message: dict) -> bytes:
+    """Encode a command as message type byte and tag, length, value."""
+    message_type = message["type"]
+    try:
+        fields = FIELDS[message_type]
+    except KeyError as e:
+        raise ValueError(f"No binary layout for {message_type}") from e
+    payload = bytearray((MESSAGE_TYPES[message_type],))
+    for key, value in message.items():
+        if key == "type":
+            continue
+        tag, kind = fields[key]
+        if kind == "i":
+            items = [INT.pack(int(value))]
+        elif kind == "s":
+            items = [str(value).encode("utf-8")]
+        else:
+            items = [str(item).encode("utf-8") for item in value]
+        for item in items:
+            if len(item) > 0xFF:
+                raise ValueError(f"{key} is too long: {len(item)} bytes")
+            payload += bytes((tag, len(item)))
+            payload += item
+    return bytes(payload)
+
+
+def decode(payload: bytes) -> dict:
+    """Reference decoder of ``encode`` for the device side."""
+    types = {code: name for name, code in MESSAGE_TYPES.items()}
+    if not payload or payload[0] not in types:
+        raise BleDataException(f"Unknown command type: {payload[:1]!r}")
+    message_type = types[payload[0]]
+    tags = {
+        tag: (key, kind) for key, (tag, kind) in FIELDS[message_type].items()
+    }
+    message: dict = {"type": message_type}
+    offset = 1
+    while offset < len(payload):
+        if offset + 2 > len(payload):
+            raise BleDataException("Truncated command field")
+        tag, length = payload[offset], payload[offset + 1]
+        value = payload[offset + 2 : offset + 2 + length]
+        offset += 2 + length
+        if tag not in tags or len(value) != length:
+            raise BleDataException(f"Invalid command field: {tag}")
+        key, kind = tags[tag]
+        if kind == "i":
+            message[key] = INT.unpack(value)[0]
+        elif kind == "s":
+            message[key] = value.decode("utf-8")
+        else:
+            message.setdefault(key, []).append(value.decode("utf-8"))
+    return message
+
+
+def chunk(payload: bytes, size: int) -> list[bytes]:
+    """Split into writes of at most ``size`` bytes with a chunk header."""
+    step = size - 1
+    count = max(1, -(-len(payload) // step))
+    if count > MORE:
+        raise ValueError(f"Command needs too many chunks: {count}")
+    return [
+        bytes(((MORE if index < count - 1 else 0) | index,))
+        + payload[index * step : (index + 1) * step]
+        for index in range(count)
+    ]
+
+
+def join(chunks: list[bytes]) -> bytes:
+    """Reassemble the chunks written by ``chunk``."""
+    payload = bytearray()
+    for index, part in enumerate(chunks):
+        if part[0] & ~MORE != index:
+            raise BleDataException(f"Chunk {part[0] & ~MORE} out of order")
+        payload += part[1:]
+    if chunks and chunks[-1][0] & MORE:
+        raise BleDataException("Last chunk is missing")
+    return bytes(payload)
@@ -0,0 +1,273 @@
+# Standard Library
+import dataclasses
+import struct
+
+from operator import itemgetter
+from typing import Callable
+
+# Library
+from apps.sit_gateway.adapter.exceptions import BleDataException
+from apps.sit_gateway.domain.data import MsgData, MsgDataBatch, SimpleMsgData
+
+
+@dataclasses.dataclass(frozen=True)
+class PacketFormat:
+    """Precompiled layout of one firmware notification.
+
+    ``fields`` names the target dataclass field for every value in the
+    struct layout, ``None`` marks values that are not forwarded.
+    """
+
+    name: str
+    layout: struct.Struct
+    factory: Callable
+    fields: tuple[str | None, ...]
+    version: int | None = None
+    _text: tuple[int, ...] = ()
+    _picker: Callable = tuple
+    _defaults: tuple = ()
+
+    @property
+    def size(self) -> int:
+        return self.layout.size
+
+    def decode(self, data):
+        values = list(self.layout.unpack(data))
+        for index in self._text:
+            values[index] = values[index].decode("utf-8")
+        values += self._defaults
+        return self.factory(*self._picker(values))
+
+
+@dataclasses.dataclass(frozen=True)
+class BatchFormat:
+    """Layout of a notification packing several records behind a header.
+
+    The header starts with the version byte and the record count followed
+    by the strings shared by all records, the records follow back to back.
+    """
+
+    name: str
+    version: int
+    header: struct.Struct
+    record: struct.Struct
+    fields: tuple[str | None, ...]
+
+    def decode(self, data) -> MsgDataBatch:
+        _, count, msg_type, state = self.header.unpack_from(data)
+        if len(data) != self.header.size + count * self.record.size:
+            raise BleDataException(
+                f"{self.name}: {count} records do not match {len(data)} bytes"
+            )
+        records = self.record.iter_unpack(memoryview(data)[self.header.size :])
+        columns = dict.fromkeys(self.fields, ())
+        columns.update(zip(self.fields, zip(*records)))
+        columns.pop(None, None)
+        for field, default in _MSG_DATA_DEFAULTS.items():
+            columns.setdefault(field, (default,) * count)
+        return MsgDataBatch(
+            msg_type=msg_type.decode("utf-8"),
+            state=state.decode("utf-8"),
+            **columns,
+        )
+
+
+_MSG_DATA_DEFAULTS = {
+    field.name: field.default
+    for field in dataclasses.fields(MsgData)
+    if field.default is not dataclasses.MISSING
+    and field.name not in ("received_at", "decoded_at")
+}
+
+# (payload length, version byte or None) -> PacketFormat
+_FORMATS: dict[tuple[int, int | None], PacketFormat] = {}
+# version byte -> BatchFormat
+_BATCH_FORMATS: dict[int, BatchFormat] = {}
+
+
+def register_format(
+    name: str,
+    layout: str,
+    factory: Callable,
+    fields: tuple[str | None, ...],
+    version: int | None = None,
+) -> PacketFormat:
+    compiled = struct.Struct(layout)
+    values = compiled.unpack(bytes(compiled.size))
+    if len(values) != len(fields):
+        raise ValueError(
+            f"{name}: layout has {len(values)} values, "
+            f"{len(fields)} fields given"
+        )
+
+    # Build the positional argument order of the dataclass once, fields
+    # the packet does not carry are taken from the dataclass defaults
+    # which are appended behind the unpacked values.
+    defaults = []
+    positions = []
+    for field in dataclasses.fields(factory):
+        if field.name in fields:
+            positions.append(fields.index(field.name))
+        elif field.default is not dataclasses.MISSING:
+            positions.append(len(fields) + len(defaults))
+            defaults.append(field.default)
+        else:
+            raise ValueError(f"{name}: field {field.name} is not mapped")
+
+    packet_format = PacketFormat(
+        name=name,
+        layout=compiled,
+        factory=factory,
+        fields=fields,
+        version=version,
+        _text=tuple(
+            index
+            for index, value in enumerate(values)
+            if isinstance(value, bytes) and fields[index] is not None
+        ),
+        _picker=itemgetter(*positions),
+        _defaults=tuple(defaults),
+    )
+    key = (compiled.size, version)
+    if key in _FORMATS:
+        raise ValueError(f"{name}: {key} already registered")
+    _FORMATS[key] = packet_format
+    return packet_format
+
+
+def register_batch_format(
+    name: str,
+    version: int,
+    layout: str,
+    fields: tuple[str | None, ...],
+) -> BatchFormat:
+    # Version bytes below 0x20 can't be confused with the first character
+    # of the msg_type string the single record formats start with.
+    if not 0 < version < 0x20:
+        raise ValueError(f"{name}: version must be in 0x01..0x1f")
+    if version in _BATCH_FORMATS:
+        raise ValueError(f"{name}: version {version} already registered")
+    record = struct.Struct(layout)
+    if len(record.unpack(bytes(record.size))) != len(fields):
+        raise ValueError(f"{name}: layout does not match fields")
+    for field in dataclasses.fields(MsgDataBatch)[2:]:
+        if field.default is not dataclasses.MISSING:
+            continue
+        if field.name not in fields and field.name not in _MSG_DATA_DEFAULTS:
+            raise ValueError(f"{name}: field {field.name} is not mapped")
+    batch_format = BatchFormat(
+        name=name,
+        version=version,
+        header=struct.Struct("B B 15s 15s"),
+        record=record,
+        fields=fields,
+    )
+    _BATCH_FORMATS[version] = batch_format
+    return batch_format
+
+
+def get_format(data) -> PacketFormat | BatchFormat:
+    size = len(data)
+    if size and (batch_format := _BATCH_FORMATS.get(data[0])):
+        return batch_format
+    if size and (packet_format := _FORMATS.get((size, data[0]))):
+        return packet_format
+    if packet_format := _FORMATS.get((size, None)):
+        return packet_format
+    raise BleDataException(f"Data length not correct: {size}")
+
+
+def decode(data) -> MsgData | MsgDataBatch | SimpleMsgData:
+    try:
+        return get_format(data).decode(data)
+    except struct.error as e:
+        raise BleDataException(str(e)) from e
+
+
+# Datatype 15 char[] (c string) and f->float and I->uint32_t and H->uint16_t
+DSTWR_MSG = register_format(
+    "dstwr_msg_structure",
+    "15s 15s H I I f f f f f",
+    MsgData,
+    (
+        "msg_type",
+        "state",
+        "responder",
+        "sequence",
+        "measurement",
+        "distance",
+        "time_round_1",
+        "time_round_2",
+        "time_reply_1",
+        "time_reply_2",
+    ),
+)
+
+DSTWR_MSG_ALL = register_format(
+    "dstwr_msg_structure_all",
+    "15s 15s H I I f f f f f f f H H",
+    MsgData,
+    (
+        "msg_type",
+        "state",
+        "responder",
+        "sequence",
+        "measurement",
+        "distance",
+        "time_round_1",
+        "time_round_2",
+        "time_reply_1",
+        "time_reply_2",
+        "rssi",
+        "fpi",
+        None,
+        "nlos",
+    ),
+)
+
+SIMPLE_MSG = register_format(
+    "simple_msg_sturcture",
+    "15s I I f f f f f f f f f f f f f f f I",
+    SimpleMsgData,
+    (
+        "msg_type",
+        "sequence",
+        "measurement",
+        "time_m21",
+        "time_m31",
+        "time_a21",
+        "time_a31",
+        "time_b21",
+        "time_b31",
+        "time_tc_i",
+        "time_tc_ii",
+        "time_tb_i",
+        "time_tb_ii",
+        "time_round_1",
+        "time_round_2",
+        "time_reply_1",
+        "time_reply_2",
+        "distance",
+        None,
+    ),
+)
+
+DSTWR_MSG_BATCH = register_batch_format(
+    "dstwr_msg_batch",
+    0x01,
+    "H I I f f f f f f f H H",
+    (
+        "responder",
+        "sequence",
+        "measurement",
+        "distance",
+        "time_round_1",
+        "time_round_2",
+        "time_reply_1",
+        "time_reply_2",
+        "rssi",
+        "fpi",
+        None,
+        "nlos",
+    ),
+)
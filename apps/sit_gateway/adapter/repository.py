@@ -0,0 +1,233 @@
+# Standard Library
+import json
+import sqlite3
+import time
+
+
+class CalibrationRepository:
+    """Finished calibration rounds and the calibrated devices in SQLite.
+
+    Both are keyed by the calibration parameters, see
+    ``domain.calibration.calibration_params``, rounds by the ordered
+    device ids of the round as well. ``solved_at`` of a device is set
+    once its antenna delays are solved from the rounds.
+    """
+
+    def __init__(self, connection: sqlite3.Connection) -> None:
+        self._connection = connection
+        self._connection.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS calibration_round (
+                params TEXT NOT NULL,
+                devices TEXT NOT NULL,
+                calibration_id INTEGER NOT NULL,
+                measurements INTEGER NOT NULL,
+                mean_distance REAL,
+                finished_at REAL NOT NULL,
+                PRIMARY KEY (params, devices)
+            );
+            CREATE TABLE IF NOT EXISTS calibration_device (
+                params TEXT NOT NULL,
+                device_id TEXT NOT NULL,
+                address TEXT NOT NULL,
+                rx_ant_dly REAL NOT NULL,
+                tx_ant_dly REAL NOT NULL,
+                updated_at REAL NOT NULL,
+                solved_at REAL,
+                PRIMARY KEY (params, device_id)
+            );
+            """
+        )
+
+    def add_round(
+        self,
+        params: str,
+        devices: list[str],
+        calibration_id: int,
+        measurements: int,
+        mean_distance: float | None,
+    ) -> None:
+        self._connection.execute(
+            "INSERT OR REPLACE INTO calibration_round "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (
+                params,
+                json.dumps(devices),
+                calibration_id,
+                measurements,
+                mean_distance,
+                time.time(),
+            ),
+        )
+
+    def finished_rounds(
+        self,
+        params: str,
+        since: float = 0.0,
+        calibration_id: int | None = None,
+    ) -> set[tuple[str, ...]]:
+        query = (
+            "SELECT devices FROM calibration_round "
+            "WHERE params = ? AND finished_at >= ?"
+        )
+        args: tuple = (params, since)
+        if calibration_id is not None:
+            query += " AND calibration_id = ?"
+            args += (calibration_id,)
+        rows = self._connection.execute(query, args)
+        return {tuple(json.loads(devices)) for (devices,) in rows}
+
+    def round_results(
+        self, params: str, since: float = 0.0
+    ) -> list[tuple[list[str], int, float | None]]:
+        """Devices, record count and mean distance of the rounds."""
+        rows = self._connection.execute(
+            "SELECT devices, measurements, mean_distance "
+            "FROM calibration_round WHERE params = ? AND finished_at >= ?",
+            (params, since),
+        )
+        return [
+            (json.loads(devices), measurements, mean_distance)
+            for devices, measurements, mean_distance in rows
+        ]
+
+    def set_device(
+        self,
+        params: str,
+        device_id: str,
+        address: str,
+        rx_ant_dly: float,
+        tx_ant_dly: float,
+    ) -> None:
+        """Add the device or update its address.
+
+        The delays are those of a new device, the delays of a known
+        device are kept unless it moved to another address.
+        """
+        self._connection.execute(
+            "INSERT INTO calibration_device "
+            "VALUES (?, ?, ?, ?, ?, ?, NULL) "
+            "ON CONFLICT (params, device_id) DO UPDATE SET "
+            "rx_ant_dly = CASE WHEN address = excluded.address "
+            "THEN rx_ant_dly ELSE excluded.rx_ant_dly END, "
+            "tx_ant_dly = CASE WHEN address = excluded.address "
+            "THEN tx_ant_dly ELSE excluded.tx_ant_dly END, "
+            "solved_at = CASE WHEN address = excluded.address "
+            "THEN solved_at END, "
+            "address = excluded.address, "
+            "updated_at = excluded.updated_at",
+            (params, device_id, address, rx_ant_dly, tx_ant_dly, time.time()),
+        )
+
+    def set_antenna_delays(
+        self, params: str, device_id: str, rx_ant_dly: float, tx_ant_dly: float
+    ) -> None:
+        now = time.time()
+        self._connection.execute(
+            "UPDATE calibration_device "
+            "SET rx_ant_dly = ?, tx_ant_dly = ?, updated_at = ?, "
+            "solved_at = ? WHERE params = ? AND device_id = ?",
+            (rx_ant_dly, tx_ant_dly, now, now, params, device_id),
+        )
+
+    def antenna_delays(self, device_id: str) -> dict | None:
+        """The latest solved delays of the device, of any parameters."""
+        row = self._connection.execute(
+            "SELECT address, rx_ant_dly, tx_ant_dly FROM calibration_device "
+            "WHERE device_id = ? AND solved_at IS NOT NULL "
+            "ORDER BY solved_at DESC LIMIT 1",
+            (device_id,),
+        ).fetchone()
+        if row is None:
+            return None
+        address, rx_ant_dly, tx_ant_dly = row
+        return {
+            "address": address,
+            "rx_ant_dly": int(rx_ant_dly),
+            "tx_ant_dly": int(tx_ant_dly),
+        }
+
+    def devices(self, params: str) -> dict[str, dict]:
+        rows = self._connection.execute(
+            "SELECT device_id, address, rx_ant_dly, tx_ant_dly, updated_at "
+            "FROM calibration_device WHERE params = ?",
+            (params,),
+        )
+        return {
+            device_id: {
+                "address": address,
+                "rx_ant_dly": rx_ant_dly,
+                "tx_ant_dly": tx_ant_dly,
+                "updated_at": updated_at,
+            }
+            for device_id, address, rx_ant_dly, tx_ant_dly, updated_at in rows
+        }
+
+
+class SessionRepository:
+    """Calibration and test sessions with the command that started them.
+
+    ``progress`` holds what a session needs to resume, the finished
+    rounds of a calibration are in the ``CalibrationRepository``.
+    """
+
+    def __init__(self, connection: sqlite3.Connection) -> None:
+        self._connection = connection
+        self._connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS session (
+                session_id TEXT PRIMARY KEY,
+                command_type TEXT NOT NULL,
+                command TEXT NOT NULL,
+                progress TEXT NOT NULL,
+                finished INTEGER NOT NULL,
+                updated_at REAL NOT NULL
+            )
+            """
+        )
+
+    def start(self, session_id: str, command_type: str, command: dict):
+        self._connection.execute(
+            "INSERT OR REPLACE INTO session VALUES (?, ?, ?, '{}', 0, ?)",
+            (session_id, command_type, json.dumps(command), time.time()),
+        )
+
+    def checkpoint(self, session_id: str, progress: dict) -> None:
+        self._connection.execute(
+            "UPDATE session SET progress = ?, updated_at = ? "
+            "WHERE session_id = ?",
+            (json.dumps(progress), time.time(), session_id),
+        )
+
+    def finish(self, session_id: str) -> None:
+        self._connection.execute(
+            "UPDATE session SET finished = 1, updated_at = ? "
+            "WHERE session_id = ?",
+            (time.time(), session_id),
+        )
+
+    def get(self, session_id: str = "") -> dict | None:
+        """The session, without an id the latest unfinished one."""
+        if session_id:
+            rows = self._connection.execute(
+                "SELECT session_id, command_type, command, progress, finished "
+                "FROM session WHERE session_id = ?",
+                (session_id,),
+            )
+        else:
+            rows = self._connection.execute(
+                "SELECT session_id, command_type, command, progress, finished "
+                "FROM session WHERE finished = 0 "
+                "ORDER BY updated_at DESC LIMIT 1"
+            )
+        row = rows.fetchone()
+        if row is None:
+            return None
+        session_id, command_type, command, progress, finished = row
+        return {
+            "session_id": session_id,
+            "command_type": command_type,
+            "command": json.loads(command),
+            "progress": json.loads(progress),
+            "finished": bool(finished),
+        }
@@ -0,0 +1,128 @@
+# Standard Library
+import asyncio
+import dataclasses
+import logging
+import logging.config
+import time
+
+# Third Party
+from bleak import BleakScanner
+from bleak.backends.device import BLEDevice
+from bleak.backends.scanner import AdvertisementData
+from bleak.exc import BleakError
+
+
+LOG_CONFIG_PATH = "settings/logging.conf"
+
+logging.config.fileConfig(LOG_CONFIG_PATH)
+# create logger
+logger = logging.getLogger("pi_ble")
+
+
+@dataclasses.dataclass
+class SeenDevice:
+    name: str
+    address: str
+    rssi: int
+    last_seen: float
+    uuids: list[str]
+    device: BLEDevice
+
+
+class DeviceRegistry:
+    """Devices seen by the background scanner.
+
+    Entries expire ``expiry`` seconds after the last advertisement, the
+    last known BLEDevice of a name is kept to reconnect without a scan.
+    """
+
+    def __init__(self, expiry: float = 30.0) -> None:
+        self.expiry = expiry
+        self._seen: dict[str, SeenDevice] = {}
+        self._known: dict[str, BLEDevice] = {}
+        self._changed = asyncio.Event()
+
+    def __len__(self) -> int:
+        return len(self._seen)
+
+    def update(self, device: BLEDevice, advertisement: AdvertisementData):
+        name = device.name or advertisement.local_name
+        if not name:
+            return
+        self._seen[device.address] = SeenDevice(
+            name=name,
+            address=device.address,
+            rssi=advertisement.rssi,
+            last_seen=time.monotonic(),
+            uuids=list(advertisement.service_uuids),
+            device=device,
+        )
+        self._known[name] = device
+        self._changed.set()
+
+    def expire(self) -> None:
+        deadline = time.monotonic() - self.expiry
+        for address in [
+            address
+            for address, seen in self._seen.items()
+            if seen.last_seen < deadline
+        ]:
+            del self._seen[address]
+
+    def find(self, device_name: str) -> SeenDevice | None:
+        """The advertising device of exactly this name, SIT-1 isn't SIT-10."""
+        deadline = time.monotonic() - self.expiry
+        for seen in self._seen.values():
+            if seen.name == device_name and seen.last_seen >= deadline:
+                return seen
+        return None
+
+    def known(self, device_name: str) -> BLEDevice | None:
+        """Last BLEDevice seen with this name, also after it expired."""
+        return self._known.get(device_name)
+
+    async def wait_for(
+        self, device_name: str, timeout: float
+    ) -> SeenDevice | None:
+        deadline = time.monotonic() + timeout
+        while (seen := self.find(device_name)) is None:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            self._changed.clear()
+            try:
+                await asyncio.wait_for(self._changed.wait(), remaining)
+            except asyncio.TimeoutError:
+                return None
+        return seen
+
+
+class BackgroundScanner:
+    """Keeps a BleakScanner running that feeds the device registry."""
+
+    def __init__(
+        self, registry: DeviceRegistry, retry_delay: float = 5.0
+    ) -> None:
+        self.registry = registry
+        self.retry_delay = retry_delay
+        self.is_running = False
+
+    async def run(self):
+        while True:
+            try:
+                async with BleakScanner(
+                    detection_callback=self.registry.update
+                ):
+                    self.is_running = True
+                    logger.info("Background scanner started")
+                    while True:
+                        await asyncio.sleep(self.registry.expiry)
+                        self.registry.expire()
+            except BleakError as e:
+                logger.error(f"Background scanner failed: {e}")
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                # e.g. no system D-Bus, the gateway has to keep running
+                logger.error(f"Background scanner failed: {e!r}")
+            finally:
+                self.is_running = False
+            await asyncio.sleep(self.retry_delay)
@@ -0,0 +1,265 @@
+# Standard Library
+import asyncio
+import logging
+import logging.config
+import os
+import struct
+import zlib
+
+
+LOG_CONFIG_PATH = "settings/logging.conf"
+
+logging.config.fileConfig(LOG_CONFIG_PATH)
+# create logger
+logger = logging.getLogger("spool")
+
+# payload length, crc32 of the payload, frame kind
+RECORD_HEADER = struct.Struct("<IIB")
+TEXT = 0
+BINARY = 1
+
+SEGMENT_SUFFIX = ".seg"
+POSITION_FILE = "replay.pos"
+
+
+class Spool:
+    """Append only, segment rotated log of uplink frames on local disk.
+
+    Frames are written with a length and crc32 prefix, so a torn write
+    at the end of a segment is detected after a crash and skipped.
+    ``commit()`` marks the frames read so far as delivered, without disk
+    I/O. ``checkpoint()`` fsyncs the written frames, stores the delivered
+    position in ``replay.pos`` and deletes fully delivered segments, it is
+    meant to run every ``fsync_interval`` seconds. When the
+    spool grows beyond ``max_bytes`` the oldest segments are dropped.
+    """
+
+    def __init__(
+        self,
+        directory: str = "spool",
+        segment_bytes: int = 4 * 1024 * 1024,
+        max_bytes: int = 256 * 1024 * 1024,
+        fsync_interval: float = 1.0,
+    ) -> None:
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.max_bytes = max_bytes
+        self.fsync_interval = fsync_interval
+
+        self.appended = 0
+        self.replayed = 0
+        self.dropped_segments = 0
+        self.dropped_bytes = 0
+
+        os.makedirs(directory, exist_ok=True)
+        self._segments: list[int] = sorted(
+            int(name[: -len(SEGMENT_SUFFIX)])
+            for name in os.listdir(directory)
+            if name.endswith(SEGMENT_SUFFIX)
+        )
+        self._read_segment, self._read_offset = self._load_position()
+        # Never append behind a possibly torn tail of the last run
+        self._write_segment = (self._segments[-1] + 1) if self._segments else 0
+        self._segments.append(self._write_segment)
+        if self._read_segment not in self._segments:
+            self._read_segment = min(
+                (s for s in self._segments if s >= self._read_segment),
+                default=self._write_segment,
+            )
+            self._read_offset = 0
+        self._writer = open(self._path(self._write_segment), "ab")
+        self._unsynced = False
+        # Duplicated descriptors of written segments to fsync
+        self._sync_fds: list[int] = []
+        self._delivered = (self._read_segment, self._read_offset)
+        self._checkpointed = self._delivered
+        if self.pending_bytes:
+            logger.info(f"Spool has {self.pending_bytes} bytes to replay")
+
+    @property
+    def has_pending(self) -> bool:
+        return (
+            self._read_segment != self._write_segment
+            or self._read_offset < self._writer.tell()
+        )
+
+    @property
+    def disk_bytes(self) -> int:
+        return sum(self._size(segment) for segment in self._segments)
+
+    @property
+    def pending_bytes(self) -> int:
+        return (
+            sum(
+                self._size(segment)
+                for segment in self._segments
+                if segment >= self._read_segment
+            )
+            - self._read_offset
+        )
+
+    def stats(self) -> dict:
+        return {
+            "segments": len(self._segments),
+            "disk_bytes": self.disk_bytes,
+            "pending_bytes": self.pending_bytes,
+            "appended": self.appended,
+            "replayed": self.replayed,
+            "dropped_segments": self.dropped_segments,
+            "dropped_bytes": self.dropped_bytes,
+        }
+
+    def append(self, frame: str | bytes) -> None:
+        if isinstance(frame, bytes):
+            kind, payload = BINARY, frame
+        else:
+            kind, payload = TEXT, frame.encode("utf-8")
+        self._writer.write(
+            RECORD_HEADER.pack(len(payload), zlib.crc32(payload), kind)
+        )
+        self._writer.write(payload)
+        self.appended += 1
+        self._unsynced = True
+        if self._writer.tell() >= self.segment_bytes:
+            self._rotate()
+
+    def read(self, max_frames: int) -> list[str | bytes]:
+        """Read the next frames, the position is kept by commit()."""
+        self._writer.flush()
+        frames: list[str | bytes] = []
+        while len(frames) < max_frames:
+            with open(self._path(self._read_segment), "rb") as segment:
+                segment.seek(self._read_offset)
+                while len(frames) < max_frames:
+                    frame = self._read_record(segment)
+                    if frame is None:
+                        break
+                    frames.append(frame)
+                self._read_offset = segment.tell()
+            if len(frames) >= max_frames:
+                break
+            if self._read_segment == self._write_segment:
+                break
+            # The rest of an older segment is done or torn, go on
+            self._read_segment = self._segments[
+                self._segments.index(self._read_segment) + 1
+            ]
+            self._read_offset = 0
+        self.replayed += len(frames)
+        return frames
+
+    def commit(self) -> None:
+        """Mark the frames read so far as delivered."""
+        self._delivered = (self._read_segment, self._read_offset)
+
+    async def checkpoint(self) -> None:
+        """Fsync the written frames and persist the delivered position.
+
+        Does nothing if no frame was written or delivered since the last
+        checkpoint. The disk writes run in a worker thread.
+        """
+        position = self._delivered
+        if not self._unsynced and position == self._checkpointed:
+            return
+        fds, replayed = self._prepare_checkpoint(position)
+        await asyncio.to_thread(
+            self._write_checkpoint, fds, position, replayed
+        )
+        self._checkpointed = position
+
+    def close(self) -> None:
+        position = self._delivered
+        fds, replayed = self._prepare_checkpoint(position)
+        self._write_checkpoint(fds, position, replayed)
+        self._writer.close()
+
+    def _prepare_checkpoint(
+        self, position: tuple[int, int]
+    ) -> tuple[list[int], list[str]]:
+        """Take the descriptors to fsync and the delivered segment files."""
+        if self._unsynced:
+            self._writer.flush()
+            self._sync_fds.append(os.dup(self._writer.fileno()))
+            self._unsynced = False
+        fds, self._sync_fds = self._sync_fds, []
+        replayed = []
+        while self._segments[0] < position[0]:
+            replayed.append(self._path(self._segments.pop(0)))
+        return fds, replayed
+
+    def _write_checkpoint(
+        self,
+        fds: list[int],
+        position: tuple[int, int],
+        replayed: list[str],
+    ) -> None:
+        try:
+            for fd in fds:
+                os.fsync(fd)
+        finally:
+            for fd in fds:
+                os.close(fd)
+        tmp_path = os.path.join(self.directory, POSITION_FILE + ".tmp")
+        with open(tmp_path, "wb") as position_file:
+            position_file.write(struct.pack("<QQ", *position))
+            position_file.flush()
+            os.fsync(position_file.fileno())
+        os.replace(tmp_path, os.path.join(self.directory, POSITION_FILE))
+        for path in replayed:
+            os.remove(path)
+
+    def _rotate(self) -> None:
+        # The next checkpoint fsyncs the closed segment
+        self._writer.flush()
+        self._sync_fds.append(os.dup(self._writer.fileno()))
+        self._writer.close()
+        self._write_segment += 1
+        self._segments.append(self._write_segment)
+        self._writer = open(self._path(self._write_segment), "ab")
+        while self.disk_bytes > self.max_bytes and len(self._segments) > 1:
+            self._drop_oldest()
+
+    def _drop_oldest(self) -> None:
+        segment = self._segments.pop(0)
+        size = self._size(segment)
+        if segment == self._read_segment:
+            size -= self._read_offset
+            self._read_segment, self._read_offset = self._segments[0], 0
+        os.remove(self._path(segment))
+        self.dropped_segments += 1
+        self.dropped_bytes += size
+        logger.warning(
+            f"Spool full, dropped {size} bytes of segment {segment}"
+        )
+
+    def _read_record(self, segment) -> str | bytes | None:
+        header = segment.read(RECORD_HEADER.size)
+        if len(header) < RECORD_HEADER.size:
+            segment.seek(-len(header), os.SEEK_CUR)
+            return None
+        size, crc, kind = RECORD_HEADER.unpack(header)
+        payload = segment.read(size)
+        if len(payload) < size or zlib.crc32(payload) != crc:
+            segment.seek(-len(header) - len(payload), os.SEEK_CUR)
+            return None
+        return payload if kind == BINARY else payload.decode("utf-8")
+
+    def _load_position(self) -> tuple[int, int]:
+        try:
+            with open(
+                os.path.join(self.directory, POSITION_FILE), "rb"
+            ) as position:
+                return struct.unpack("<QQ", position.read())
+        except (OSError, struct.error):
+            return (self._segments[0] if self._segments else 0), 0
+
+    def _path(self, segment: int) -> str:
+        return os.path.join(self.directory, f"{segment:012d}{SEGMENT_SUFFIX}")
+
+    def _size(self, segment: int) -> int:
+        if segment == self._write_segment:
+            return self._writer.tell()
+        try:
+            return os.path.getsize(self._path(segment))
+        except OSError:
+            return 0
@@ -1,36 +1,86 @@
 # Standard Library
 import inspect
+import time
 
-from apps.sit_gateway.service_layer import messagebus, uow
-from apps.sit_gateway.service_layer.handler import command_handler, event_handler
+from apps.sit_gateway.service_layer import (
+    batching,
+    messagebus,
+    metrics,
+    summary,
+    uow,
+)
+from apps.sit_gateway.service_layer.handler import (
+    command_handler,
+    event_handler,
+)
 
 
-def bootstrap(uow: uow.UnitOfWork, ws, gateway):
-    dependencies = {"uow": uow, "ws": ws, "gateway": gateway}
+def bootstrap(
+    uow: uow.UnitOfWork,
+    ws,
+    gateway,
+    batcher: batching.MeasurementBatcher | None = None,
+    summarizer: summary.MeasurementSummarizer | None = None,
+    concurrent_events: bool = False,
+    workers: int = 1,
+    bus_metrics: metrics.Metrics | None = None,
+):
+    if batcher is None:
+        batcher = batching.MeasurementBatcher()
+    if summarizer is None:
+        summarizer = summary.MeasurementSummarizer()
+    dependencies = {
+        "uow": uow,
+        "ws": ws,
+        "gateway": gateway,
+        "batcher": batcher,
+        "summarizer": summarizer,
+    }
 
     injected_event_handlers = {
         event_type: [
-            inject_dependencies(handler, dependencies)
+            inject_dependencies(handler, dependencies, bus_metrics)
             for handler in event_handlers
         ]
         for event_type, event_handlers in event_handler.EVENT_HANDLER.items()
     }
 
     injected_command_handlers = {
-        command_type: inject_dependencies(handler, dependencies)
+        command_type: inject_dependencies(handler, dependencies, bus_metrics)
         for command_type, handler in command_handler.COMMAND_HANDLER.items()
     }
 
     return messagebus.MessageBus(
-        uow, injected_event_handlers, injected_command_handlers
+        uow,
+        injected_event_handlers,
+        injected_command_handlers,
+        concurrent_events=concurrent_events,
+        workers=workers,
+        metrics=bus_metrics,
     )
 
 
-def inject_dependencies(handler, dependencies):
+def inject_dependencies(handler, dependencies, bus_metrics=None):
     params = inspect.signature(handler).parameters
     deps = {
         name: dependency
         for name, dependency in dependencies.items()
         if name in params
     }
-    return lambda message: handler(message, **deps)
+    if bus_metrics is None:
+        return lambda message: handler(message, **deps)
+
+    name = handler.__name__
+
+    async def timed_handler(message):
+        start = time.perf_counter()
+        failed = True
+        try:
+            await handler(message, **deps)
+            failed = False
+        finally:
+            bus_metrics.observe_handler(
+                name, time.perf_counter() - start, failed
+            )
+
+    return timed_handler
@@ -0,0 +1,161 @@
+# Standard Library
+import json
+
+
+def calibration_params(setup) -> str:
+    """Key of the results of a calibration, all but its id and devices."""
+    return json.dumps(
+        {
+            "measurement_type": setup.measurement_type,
+            "max_measurement": setup.max_measurement,
+            "rx_ant_dly": setup.rx_ant_dly,
+            "tx_ant_dly": setup.tx_ant_dly,
+        },
+        sort_keys=True,
+    )
+
+
+def plan_waves(
+    rounds: list[list[str]], max_radios: int = 0
+) -> list[list[list[str]]]:
+    """Pack calibration rounds into waves that can run at the same time.
+
+    Rounds of one wave share no device. Every round goes into the first
+    wave it fits, a wave holds at most ``max_radios`` devices, 0 means
+    no limit. The order of the rounds inside a wave is kept.
+    """
+    waves: list[list[list[str]]] = []
+    busy: list[set[str]] = []
+    for devices in rounds:
+        needed = set(devices)
+        for wave, used in zip(waves, busy):
+            if used.isdisjoint(needed) and (
+                not max_radios or len(used) + len(needed) <= max_radios
+            ):
+                wave.append(devices)
+                used |= needed
+                break
+        else:
+            waves.append([devices])
+            busy.append(needed)
+    return waves
+
+
+SPEED_OF_LIGHT = 299_702_547.0  # m/s in air
+# Seconds per antenna delay unit, the factor the setup messages use
+ANT_DLY_UNIT = 1.026e-6 / 63898
+
+
+class AntennaDelaySolver:
+    """Least squares fit of the antenna delays of the calibrated devices.
+
+    A ranging between i and j measures the true distance plus half of
+    the summed delays (rx + tx) of both devices. With the true distances
+    known, every pair adds one equation and the delays of all devices
+    are fitted at once. At least three devices with a closed triangle of
+    pairs are needed.
+
+    Only two device rounds are supported, the rounds of three devices
+    mix the timings of the three links. Two way ranging only sees the
+    sum of rx and tx delay, each gets half of it.
+    """
+
+    def __init__(
+        self,
+        reference_distance: float = 0.0,
+        distances: list[list] | None = None,
+    ) -> None:
+        self.reference_distance = reference_distance
+        self.distances = {
+            frozenset((first, second)): float(distance)
+            for first, second, distance in distances or ()
+        }
+        # pair -> [weight, weighted sum of the distance errors]
+        self._pairs: dict[frozenset, list[float]] = {}
+
+    def true_distance(self, first: str, second: str) -> float | None:
+        distance = self.distances.get(frozenset((first, second)))
+        if distance is None and self.reference_distance:
+            distance = self.reference_distance
+        return distance
+
+    def add(
+        self, first: str, second: str, mean_distance: float, count: int = 1
+    ) -> None:
+        true_distance = self.true_distance(first, second)
+        if true_distance is None or first == second or count <= 0:
+            return
+        pair = self._pairs.setdefault(frozenset((first, second)), [0.0, 0.0])
+        pair[0] += count
+        pair[1] += count * (mean_distance - true_distance)
+
+    def solve(self) -> dict | None:
+        """Delays per device, None if the pairs don't determine them."""
+        devices = sorted({device for pair in self._pairs for device in pair})
+        index = {device: i for i, device in enumerate(devices)}
+        size = len(devices)
+        # Normal equations of error_ij = c / 2 * (delay_i + delay_j)
+        normal = [[0.0] * size for _ in range(size)]
+        rhs = [0.0] * size
+        for pair, (weight, error_sum) in self._pairs.items():
+            error = error_sum / weight
+            i, j = (index[device] for device in pair)
+            for row in (i, j):
+                normal[row][i] += weight
+                normal[row][j] += weight
+                rhs[row] += weight * error
+        solution = solve_linear(normal, rhs)
+        if solution is None:
+            return None
+        # solution is c / 2 * delay in metres
+        delays = {
+            device: 2 * solution[index[device]] / SPEED_OF_LIGHT
+            for device in devices
+        }
+        squares = 0.0
+        weights = 0.0
+        for pair, (weight, error_sum) in self._pairs.items():
+            i, j = (index[device] for device in pair)
+            residual = error_sum / weight - (solution[i] + solution[j])
+            squares += weight * residual**2
+            weights += weight
+        return {
+            "devices": {
+                device: {
+                    "delay_s": delay,
+                    # rx and tx can't be told apart, each gets half
+                    "rx_ant_dly": round(delay / 2 / ANT_DLY_UNIT),
+                    "tx_ant_dly": round(delay / 2 / ANT_DLY_UNIT),
+                }
+                for device, delay in delays.items()
+            },
+            "pairs": len(self._pairs),
+            "rms_m": (squares / weights) ** 0.5,
+        }
+
+
+def solve_linear(
+    matrix: list[list[float]], rhs: list[float]
+) -> list[float] | None:
+    """Gaussian elimination with partial pivoting, None if singular."""
+    size = len(rhs)
+    if not size:
+        return None
+    rows = [row[:] + [value] for row, value in zip(matrix, rhs)]
+    scale = max(abs(value) for row in matrix for value in row) or 1.0
+    for column in range(size):
+        pivot = max(range(column, size), key=lambda r: abs(rows[r][column]))
+        if abs(rows[pivot][column]) < 1e-9 * scale:
+            return None
+        rows[column], rows[pivot] = rows[pivot], rows[column]
+        for row in range(column + 1, size):
+            factor = rows[row][column] / rows[column][column]
+            for k in range(column, size + 1):
+                rows[row][k] -= factor * rows[column][k]
+    solution = [0.0] * size
+    for row in reversed(range(size)):
+        value = rows[row][size] - sum(
+            rows[row][k] * solution[k] for k in range(row + 1, size)
+        )
+        solution[row] = value / rows[row][row]
+    return solution
@@ -32,11 +32,88 @@ class PingWsConnection(Command):
     pass
 
 
+@dataclass
+class SetUplinkEncoding(Command):
+    encoding: str = "json"
+
+
+@dataclass
+class ConfigureUplinkBatching(Command):
+    enabled: bool
+    max_records: int = 50
+    max_delay_ms: float = 20
+
+
+@dataclass
+class ConfigureUplinkSummary(Command):
+    enabled: bool
+    interval_ms: float = 1000
+    # forward every record besides the summaries
+    raw: bool = False
+    quantiles: list[float] | None = None
+
+
+@dataclass
+class ConfigureMeasurementFilter(Command):
+    enabled: bool
+    window: int = 7
+    threshold: float = 3.0
+    # variances in square metres of the Kalman filter
+    process_noise: float = 0.0025
+    measurement_noise: float = 0.01
+
+
+@dataclass
+class ConfigurePositioning(Command):
+    enabled: bool
+    # anchor device id -> [x, y] or [x, y, z] in metres
+    anchors: dict | None = None
+    dimensions: int = 2
+    rate_hz: float = 10
+    max_age_s: float = 1.0
+    forward_distances: bool = True
+
+
+@dataclass
+class ConfigureExchangeJoin(Command):
+    enabled: bool
+    window_ms: float = 500
+    max_pending: int = 256
+
+
+@dataclass
+class ConfigureRanging(Command):
+    enabled: bool
+    # seconds per timestamp unit of the firmware, 0 the DW1000 unit
+    time_unit: float = 0.0
+    drift_smoothing: float = 0.05
+    # device id -> extra antenna delay in seconds
+    antenna_delays: dict | None = None
+
+
+@dataclass
+class GetLatencySummary(Command):
+    pass
+
+
 @dataclass
 class ConnectBleDevice(Command):
     device_id: str
 
 
+@dataclass
+class ConnectBleDevices(Command):
+    device_ids: list[str]
+    concurrency: int = 4
+
+
+@dataclass
+class SetBleCommandEncoding(Command):
+    device_id: str
+    encoding: str = "json"
+    write_without_response: bool = False
+
+
 @dataclass
 class DisconnectBleDevice(Command):
     device_id: str
@@ -47,8 +124,9 @@ class StartDistanceMeasurement(Command):
     initiator: str
     responder: list[str]
     measurement_type: str = "ds_3_twr"
-    rx_ant_dly: int = 16385
-    tx_ant_dly: int = 16385
+    # None uses the calibrated delays of the device, else 16385
+    rx_ant_dly: int | None = None
+    tx_ant_dly: int | None = None
 
 
 @dataclass
@@ -78,6 +156,16 @@ class StartCalibrationMeasurement(Command):
     measurement_type: str = "ds_3_twr"
     rx_ant_dly: int = 0
     tx_ant_dly: int = 0
+    max_radios: int = 0
+    incremental: bool = False
+    max_age_s: float = 0
+    # True distance of all pairs or [device, device, metres] per pair,
+    # to solve the antenna delays of the devices from the rounds
+    reference_distance: float = 0.0
+    distances: list | None = None
+    # False sends only the solved delays instead of every record, if
+    # there are true distances to solve them
+    raw_stream: bool = True
 
 
 @dataclass
@@ -88,6 +176,15 @@ class StartSimpleCalibrationMeasurement(Command):
     measurement_type: str = "two_device"
     rx_ant_dly: int = 0
     tx_ant_dly: int = 0
+    max_radios: int = 0
+    incremental: bool = False
+    max_age_s: float = 0
+
+
+@dataclass
+class ResumeSession(Command):
+    # "calibration:<id>" or "test:<id>", empty for the latest unfinished
+    session_id: str = ""
 
 
 @dataclass
@@ -103,3 +200,6 @@ class StartDebugCalibration(Command):
     max_measurement: int = 0
     rx_ant_dly: int = 0
     tx_ant_dly: int = 0
+    max_radios: int = 0
+    incremental: bool = False
+    max_age_s: float = 0
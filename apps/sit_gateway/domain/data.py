@@ -2,6 +2,9 @@
 import dataclasses
 import time
 
+from array import array
+from typing import Iterator
+
 
 @dataclasses.dataclass
 class MsgData:
@@ -18,6 +21,9 @@ class MsgData:
     nlos: int = 0
     rssi: float = 0.0
     fpi: float = 0.0
+    # monotonic time the notification was received and decoded
+    received_at: float = 0.0
+    decoded_at: float = 0.0
 
 
 @dataclasses.dataclass
@@ -40,3 +46,162 @@ class SimpleMsgData:
     time_reply_1: float
     time_reply_2: float
     distance: float
+
+
+@dataclasses.dataclass
+class MsgDataBatch:
+    """Several ranging records of one notification, stored per column."""
+
+    msg_type: str
+    state: str
+    responder: tuple[int, ...]
+    sequence: tuple[int, ...]
+    measurement: tuple[int, ...]
+    distance: tuple[float, ...]
+    time_round_1: tuple[float, ...]
+    time_round_2: tuple[float, ...]
+    time_reply_1: tuple[float, ...]
+    time_reply_2: tuple[float, ...]
+    nlos: tuple[int, ...]
+    rssi: tuple[float, ...]
+    fpi: tuple[float, ...]
+    received_at: float = 0.0
+    decoded_at: float = 0.0
+
+    def __len__(self) -> int:
+        return len(self.sequence)
+
+    def rows(self) -> Iterator[MsgData]:
+        for row in zip(
+            self.responder,
+            self.sequence,
+            self.measurement,
+            self.distance,
+            self.time_round_1,
+            self.time_round_2,
+            self.time_reply_1,
+            self.time_reply_2,
+            self.nlos,
+            self.rssi,
+            self.fpi,
+        ):
+            yield MsgData(
+                self.msg_type,
+                self.state,
+                *row,
+                received_at=self.received_at,
+                decoded_at=self.decoded_at,
+            )
+
+
+# Column name -> array typecode of the measurement ring buffer
+MEASUREMENT_COLUMNS = {
+    "sequence": "L",
+    "measurement": "L",
+    "distance": "d",
+    "time_round_1": "d",
+    "time_round_2": "d",
+    "time_reply_1": "d",
+    "time_reply_2": "d",
+    "nlos": "H",
+    "rssi": "d",
+    "fpi": "d",
+}
+
+
+class MeasurementRing:
+    """Fixed capacity column store of the measurements of one link.
+
+    Records are addressed by a cursor counting every record ever written,
+    once the ring is full the oldest records are overwritten.
+    """
+
+    def __init__(self, capacity: int = 4096) -> None:
+        self.capacity = capacity
+        self.written = 0
+        self.columns = {
+            name: array(code, bytes(array(code).itemsize * capacity))
+            for name, code in MEASUREMENT_COLUMNS.items()
+        }
+
+    def __len__(self) -> int:
+        return min(self.written, self.capacity)
+
+    @property
+    def oldest(self) -> int:
+        return max(0, self.written - self.capacity)
+
+    def append(self, msg_data: MsgData) -> int:
+        slot = self.written % self.capacity
+        columns = self.columns
+        columns["sequence"][slot] = msg_data.sequence
+        columns["measurement"][slot] = msg_data.measurement
+        columns["distance"][slot] = msg_data.distance
+        columns["time_round_1"][slot] = msg_data.time_round_1
+        columns["time_round_2"][slot] = msg_data.time_round_2
+        columns["time_reply_1"][slot] = msg_data.time_reply_1
+        columns["time_reply_2"][slot] = msg_data.time_reply_2
+        columns["nlos"][slot] = msg_data.nlos
+        columns["rssi"][slot] = msg_data.rssi
+        columns["fpi"][slot] = msg_data.fpi
+        self.written += 1
+        return self.written - 1
+
+    def extend(self, batch: MsgDataBatch) -> "MeasurementSlice":
+        count = len(batch)
+        # Only the newest records fit when the batch exceeds the capacity
+        skip = max(0, count - self.capacity)
+        start = self.written + skip
+        for name, column in self.columns.items():
+            values = getattr(batch, name)
+            slot = start % self.capacity
+            head = min(count - skip, self.capacity - slot)
+            column[slot : slot + head] = array(
+                column.typecode, values[skip : skip + head]
+            )
+            column[: count - skip - head] = array(
+                column.typecode, values[skip + head :]
+            )
+        self.written += count
+        return MeasurementSlice(self, start, self.written)
+
+    def since(self, cursor: int) -> "MeasurementSlice":
+        return MeasurementSlice(self, cursor, self.written)
+
+    def column(self, name: str, start: int, stop: int) -> array:
+        start = max(start, self.oldest)
+        stop = min(stop, self.written)
+        column = self.columns[name]
+        if start >= stop:
+            return array(column.typecode)
+        first = start % self.capacity
+        last = first + stop - start
+        if last <= self.capacity:
+            return column[first:last]
+        return column[first:] + column[: last - self.capacity]
+
+
+class MeasurementSlice:
+    """View on a range of cursors of a MeasurementRing.
+
+    Reading copies the columns, records overwritten in the meantime are
+    left out.
+    """
+
+    __slots__ = ("ring", "start", "stop")
+
+    def __init__(self, ring: MeasurementRing, start: int, stop: int) -> None:
+        self.ring = ring
+        self.start = start
+        self.stop = stop
+
+    def __len__(self) -> int:
+        return max(0, self.stop - max(self.start, self.ring.oldest))
+
+    def column(self, name: str) -> array:
+        return self.ring.column(name, self.start, self.stop)
+
+    def to_dict(self) -> dict[str, list]:
+        return {
+            name: self.column(name).tolist() for name in MEASUREMENT_COLUMNS
+        }
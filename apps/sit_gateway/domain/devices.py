@@ -0,0 +1,69 @@
+# Standard Library
+from dataclasses import dataclass
+from typing import Any, Iterator
+
+
+@dataclass(slots=True)
+class Link:
+    link_id: int
+    device_id: str
+    address: str
+    device: Any
+
+
+class DeviceTable:
+    """Connected devices by exact device id, address and link id.
+
+    Every device id gets a small integer link id the first time it is
+    seen, the id is kept when the device disconnects, so measurements of
+    a reconnected device stay on the same link.
+    """
+
+    def __init__(self) -> None:
+        self._ids: dict[str, int] = {}
+        self._names: list[str] = []
+        self._links: dict[int, Link] = {}
+        self._addresses: dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._links)
+
+    def __iter__(self) -> Iterator[Any]:
+        return iter([link.device for link in self._links.values()])
+
+    def intern(self, device_id: str) -> int:
+        link_id = self._ids.get(device_id)
+        if link_id is None:
+            link_id = self._ids[device_id] = len(self._names)
+            self._names.append(device_id)
+        return link_id
+
+    def name(self, link_id: int) -> str:
+        return self._names[link_id]
+
+    def add(self, device_id: str, address: str, device: Any) -> Link:
+        link = Link(self.intern(device_id), device_id, address, device)
+        self._links[link.link_id] = link
+        self._addresses[address] = link.link_id
+        return link
+
+    def remove(self, device_id: str) -> Link | None:
+        link_id = self._ids.get(device_id)
+        link = self._links.pop(link_id, None)
+        if link is not None:
+            self._addresses.pop(link.address, None)
+        return link
+
+    def clear(self) -> None:
+        self._links.clear()
+        self._addresses.clear()
+
+    def get(self, device_id: str) -> Any:
+        link = self._links.get(self._ids.get(device_id))
+        return link.device if link is not None else None
+
+    def link(self, link_id: int) -> Link | None:
+        return self._links.get(link_id)
+
+    def by_address(self, address: str) -> Link | None:
+        return self._links.get(self._addresses.get(address))
@@ -2,7 +2,13 @@
 # Standard Library
 from dataclasses import asdict, dataclass
 from json import dumps
-from turtle import distance
+
+# Library
+from apps.sit_gateway.domain.data import MeasurementSlice
+
+
+# Optional fields of the measurement events computed on the gateway
+GATEWAY_FIELDS = ("distance_corrected", "distance_filtered", "quality")
 
 
 @dataclass
@@ -61,6 +67,30 @@ class DistanceMeasurement(Event):
     nlos: int
     rssi: float
     fpi: float
+    received_at: float = 0.0
+    decoded_at: float = 0.0
+    # link ids of the gateway device table
+    initiator_id: int = 0
+    responder_id: int = 0
+    # computed on the gateway, None while the stage is disabled
+    distance_corrected: float | None = None
+    distance_filtered: float | None = None
+    quality: float | None = None
+
+
+@dataclass
+class DistanceMeasurementBatch(Event):
+    initiator: str
+    responder: str
+    measurement_type: str
+    records: MeasurementSlice
+    received_at: float = 0.0
+    decoded_at: float = 0.0
+    initiator_id: int = 0
+    responder_id: int = 0
+    distance_corrected: list[float] | None = None
+    distance_filtered: list[float] | None = None
+    quality: list[float] | None = None
 
 
 @dataclass
@@ -79,6 +109,13 @@ class TestMeasurement(Event):
     nlos: int
     rssi: float
     fpi: float
+    received_at: float = 0.0
+    decoded_at: float = 0.0
+    initiator_id: int = 0
+    responder_id: int = 0
+    distance_corrected: float | None = None
+    distance_filtered: float | None = None
+    quality: float | None = None
 
 
 @dataclass
@@ -122,6 +159,24 @@ class SimpleCalibrationMeasurement(Event):
     distance: float = 0.0
 
 
+@dataclass
+class CalibrationPlanned(Event):
+    calibration_id: int
+    rounds: int
+    waves: int
+    max_radios: int = 0
+    skipped: int = 0
+
+
+@dataclass
+class CalibrationRoundFinished(Event):
+    calibration_id: int
+    params: str
+    devices: list[str]
+    measurements: int
+    mean_distance: float | None = None
+
+
 @dataclass
 class CalibrationMeasurementFinished(Event):
     calibration_id: int
@@ -139,7 +194,12 @@ class CalibrationCalFinished(Event):
 
 @dataclass
 class PositionMeasurement(Event):
-    pass
+    tag: str
+    # x, y and for 3-D fixes z in the coordinates of the anchors
+    position: list[float]
+    anchors: int
+    rms_m: float
+    timestamp: float
 
 
 @dataclass
@@ -0,0 +1,112 @@
+# Standard Library
+from collections import deque
+from typing import Sequence
+
+
+# Scale of the median absolute deviation to the standard deviation
+MAD_SCALE = 1.4826
+
+
+def signal_quality(nlos: int, rssi: float, fpi: float) -> float:
+    """Quality between 0.1 and 1 of a record from its NLOS indicators.
+
+    The first path power falls behind the total received power on
+    indirect paths, a gap above 6 dB lowers the quality down to 0.1 at
+    16 dB. A set NLOS flag of the firmware scales it by 0.2.
+    """
+    quality = 1.0
+    if rssi and fpi:
+        gap = rssi - fpi
+        quality = min(1.0, max(0.1, 1.0 - (gap - 6.0) / 10.0))
+    if nlos:
+        quality *= 0.2
+    return max(0.1, quality)
+
+
+class LinkFilter:
+    """Outlier rejection and smoothing of the distances of one link.
+
+    A Hampel filter replaces distances further than ``threshold`` scaled
+    MADs from the median of the last ``window`` distances by the median,
+    a 1-D Kalman filter with a random walk model smooths the result. The
+    measurement noise grows with a lower quality of the record. The state
+    is constant per link.
+    """
+
+    __slots__ = (
+        "threshold",
+        "process_noise",
+        "measurement_noise",
+        "_window",
+        "_estimate",
+        "_variance",
+    )
+
+    def __init__(
+        self,
+        window: int = 7,
+        threshold: float = 3.0,
+        process_noise: float = 0.0025,
+        measurement_noise: float = 0.01,
+    ) -> None:
+        self.threshold = threshold
+        self.process_noise = process_noise
+        self.measurement_noise = measurement_noise
+        self._window: deque[float] = deque(maxlen=window)
+        self._estimate: float | None = None
+        self._variance = 0.0
+
+    def update(self, distance: float, quality: float = 1.0) -> float:
+        window = self._window
+        window.append(distance)
+        ordered = sorted(window)
+        median = ordered[len(ordered) // 2]
+        deviations = sorted(abs(value - median) for value in ordered)
+        mad = MAD_SCALE * deviations[len(deviations) // 2]
+        if len(window) >= 3 and abs(distance - median) > self.threshold * mad:
+            distance = median
+
+        noise = self.measurement_noise / quality
+        if self._estimate is None:
+            self._estimate = distance
+            self._variance = noise
+            return distance
+        variance = self._variance + self.process_noise
+        gain = variance / (variance + noise)
+        self._estimate += gain * (distance - self._estimate)
+        self._variance = (1 - gain) * variance
+        return self._estimate
+
+
+class MeasurementFilter:
+    """Keeps a LinkFilter per (initiator, responder) link id pair."""
+
+    def __init__(self, **settings) -> None:
+        self.enabled = False
+        self.settings = settings
+        self._links: dict[tuple[int, int], LinkFilter] = {}
+
+    def configure(self, enabled: bool, **settings) -> None:
+        self.enabled = enabled
+        self.settings = settings
+        self._links.clear()
+
+    def apply(
+        self,
+        link: tuple[int, int],
+        distance: Sequence[float],
+        nlos: Sequence[int],
+        rssi: Sequence[float],
+        fpi: Sequence[float],
+    ) -> tuple[list[float], list[float]]:
+        """Filtered distances and qualities of the columns of a link."""
+        link_filter = self._links.get(link)
+        if link_filter is None:
+            link_filter = self._links[link] = LinkFilter(**self.settings)
+        filtered = []
+        qualities = []
+        for value, flag, power, first_path in zip(distance, nlos, rssi, fpi):
+            quality = signal_quality(flag, power, first_path)
+            filtered.append(link_filter.update(value, quality))
+            qualities.append(quality)
+        return filtered, qualities
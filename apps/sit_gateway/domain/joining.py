@@ -0,0 +1,93 @@
+# Standard Library
+import dataclasses
+import time
+
+from collections import OrderedDict
+
+# Library
+from apps.sit_gateway.domain.data import MsgData
+
+
+# Fields a side of the exchange may leave at 0
+MERGED_FIELDS = (
+    "distance",
+    "time_round_1",
+    "time_round_2",
+    "time_reply_1",
+    "time_reply_2",
+    "nlos",
+    "rssi",
+    "fpi",
+)
+
+
+class ExchangeJoiner:
+    """Joins the initiator and responder notifications of an exchange.
+
+    Fragments are matched by (sequence, measurement). The responder half
+    names the responder by its link and its non zero values win over the
+    initiator's. A fragment waits at most ``window`` seconds, and at most
+    ``max_pending`` fragments wait at once. Older fragments are dropped
+    and counted as unmatched.
+    """
+
+    def __init__(self, window: float = 0.5, max_pending: int = 256) -> None:
+        self.enabled = False
+        self.window = window
+        self.max_pending = max_pending
+        self.joined = 0
+        self.unmatched = 0
+        # (sequence, measurement) -> (link, is initiator, fragment, time)
+        self._pending: OrderedDict[tuple[int, int], tuple] = OrderedDict()
+
+    def configure(self, enabled: bool, window: float, max_pending: int):
+        self.enabled = enabled
+        self.window = window
+        self.max_pending = max_pending
+        self.clear()
+
+    def clear(self) -> None:
+        self.unmatched += len(self._pending)
+        self._pending.clear()
+
+    def add(
+        self, link: int, is_initiator: bool, data: MsgData
+    ) -> tuple[int, MsgData] | None:
+        """Return the responder link and the record once it is complete."""
+        now = time.monotonic()
+        pending = self._pending
+        # Fragments are kept in arrival order, the oldest expire first
+        deadline = now - self.window
+        while pending and next(iter(pending.values()))[3] < deadline:
+            pending.popitem(last=False)
+            self.unmatched += 1
+
+        key = (data.sequence, data.measurement)
+        other = pending.get(key)
+        if other is None or other[1] == is_initiator:
+            if other is not None:
+                # a repeated half of the same side replaces the first
+                del pending[key]
+                self.unmatched += 1
+            pending[key] = (link, is_initiator, data, now)
+            if len(pending) > self.max_pending:
+                pending.popitem(last=False)
+                self.unmatched += 1
+            return None
+
+        del pending[key]
+        self.joined += 1
+        if is_initiator:
+            responder, first, second = other[0], other[2], data
+        else:
+            responder, first, second = link, data, other[2]
+        merged = {
+            name: getattr(first, name) or getattr(second, name)
+            for name in MERGED_FIELDS
+        }
+        return responder, dataclasses.replace(
+            first,
+            **merged,
+            received_at=max(first.received_at, second.received_at),
+            decoded_at=max(first.decoded_at, second.decoded_at),
+        )
@@ -0,0 +1,157 @@
+# Standard Library
+import math
+import time
+
+from dataclasses import dataclass
+
+# Library
+from apps.sit_gateway.domain.calibration import solve_linear
+
+
+@dataclass(slots=True)
+class Fix:
+    tag: str
+    position: list[float]
+    anchors: int
+    rms_m: float
+    timestamp: float
+
+
+def multilaterate(
+    anchors: list[list[float]],
+    distances: list[float],
+    weights: list[float],
+    start: list[float],
+    iterations: int = 10,
+    tolerance: float = 1e-4,
+) -> tuple[list[float], float] | None:
+    """Weighted Gauss-Newton fit of a position to the anchor distances.
+
+    Returns the position and the weighted RMS of the distance residuals,
+    None if the anchors don't determine the position.
+    """
+    position = list(start)
+    size = len(position)
+    for _ in range(iterations):
+        normal = [[0.0] * size for _ in range(size)]
+        rhs = [0.0] * size
+        for anchor, distance, weight in zip(anchors, distances, weights):
+            delta = [p - a for p, a in zip(position, anchor)]
+            norm = math.sqrt(sum(d * d for d in delta)) or 1e-9
+            gradient = [d / norm for d in delta]
+            residual = norm - distance
+            for row in range(size):
+                rhs[row] -= weight * gradient[row] * residual
+                for column in range(size):
+                    normal[row][column] += (
+                        weight * gradient[row] * gradient[column]
+                    )
+        step = solve_linear(normal, rhs)
+        if step is None:
+            return None
+        position = [p + s for p, s in zip(position, step)]
+        if math.sqrt(sum(s * s for s in step)) < tolerance:
+            break
+    squares = 0.0
+    for anchor, distance, weight in zip(anchors, distances, weights):
+        residual = math.dist(position, anchor) - distance
+        squares += weight * residual**2
+    return position, math.sqrt(squares / sum(weights))
+
+
+class PositionEngine:
+    """Positions of the tags from their latest distance to every anchor.
+
+    A fix of a tag is solved at most ``rate`` times per second, from the
+    distances not older than ``max_age`` seconds, and warm started from
+    the previous fix of the tag.
+    """
+
+    def __init__(self) -> None:
+        self.enabled = False
+        self.anchors: dict[str, list[float]] = {}
+        self.dimensions = 2
+        self.rate = 10.0
+        self.max_age = 1.0
+        # Send the distances to the backend besides the positions
+        self.forward_distances = True
+        # tag -> anchor -> (distance, weight, monotonic time)
+        self._ranges: dict[str, dict[str, tuple[float, float, float]]] = {}
+        self._fixes: dict[str, Fix] = {}
+        self._solved_at: dict[str, float] = {}
+
+    def configure(
+        self,
+        enabled: bool,
+        anchors: dict[str, list[float]],
+        dimensions: int,
+        rate: float,
+        max_age: float,
+        forward_distances: bool,
+    ) -> None:
+        """Raises ValueError if an anchor has not ``dimensions`` values."""
+        if dimensions not in (2, 3):
+            raise ValueError(f"Positions are 2-D or 3-D, not {dimensions}-D")
+        for anchor, coordinates in anchors.items():
+            if len(coordinates) != dimensions:
+                raise ValueError(
+                    f"Anchor {anchor} needs {dimensions} coordinates, "
+                    f"got {len(coordinates)}"
+                )
+        self.enabled = enabled
+        self.anchors = {
+            anchor: [float(value) for value in coordinates]
+            for anchor, coordinates in anchors.items()
+        }
+        self.dimensions = dimensions
+        self.rate = rate
+        self.max_age = max_age
+        self.forward_distances = forward_distances
+        self._ranges.clear()
+        self._fixes.clear()
+        self._solved_at.clear()
+
+    def add(
+        self, tag: str, anchor: str, distance: float, weight: float = 1.0
+    ) -> Fix | None:
+        """Store a distance, return a new fix of the tag if one is due."""
+        if anchor not in self.anchors:
+            return None
+        now = time.monotonic()
+        ranges = self._ranges.setdefault(tag, {})
+        ranges[anchor] = (distance, weight, now)
+        solved_at = self._solved_at.get(tag, -math.inf)
+        if self.rate > 0 and now - solved_at < 1 / self.rate:
+            return None
+
+        deadline = now - self.max_age
+        fresh = [
+            (name, value, quality)
+            for name, (value, quality, seen) in ranges.items()
+            if seen >= deadline
+        ]
+        if len(fresh) <= self.dimensions:
+            return None
+        coordinates = [self.anchors[name] for name, _, _ in fresh]
+        previous = self._fixes.get(tag)
+        if previous is not None:
+            start = previous.position
+        else:
+            start = [sum(values) / len(values) for values in zip(*coordinates)]
+            if self.dimensions == 3:
+                # Tags are mostly below the anchors, start there to not
+                # converge to the mirror position of coplanar anchors
+                start[2] -= 1.0
+        result = multilaterate(
+            coordinates,
+            [value for _, value, _ in fresh],
+            [quality for _, _, quality in fresh],
+            start,
+        )
+        self._solved_at[tag] = now
+        if result is None:
+            return None
+        position, rms = result
+        fix = Fix(tag, position, len(fresh), rms, time.time())
+        self._fixes[tag] = fix
+        return fix
@@ -0,0 +1,89 @@
+# Standard Library
+from typing import Sequence
+
+# Library
+from apps.sit_gateway.domain.calibration import SPEED_OF_LIGHT
+
+
+# Seconds per DW1000 timestamp unit, 1 / (128 * 499.2 MHz)
+DWT_TIME_UNIT = 1.0 / (128 * 499.2e6)
+
+
+class RangingEstimator:
+    """Distances recomputed from the TWR timestamps of the records.
+
+    ``time_round_1`` and ``time_reply_2`` are taken by the initiator,
+    ``time_reply_1`` and ``time_round_2`` by the responder. Every
+    DS-TWR record updates a smoothed clock ratio of its link, SS-TWR
+    records scale the reply time of the responder with it. The antenna
+    delays are extra delays in seconds per link id on top of the ones
+    the devices are set up with, see ``AntennaDelaySolver``.
+    """
+
+    def __init__(
+        self,
+        time_unit: float = DWT_TIME_UNIT,
+        drift_smoothing: float = 0.05,
+    ) -> None:
+        self.enabled = False
+        self.time_unit = time_unit
+        self.drift_smoothing = drift_smoothing
+        self.antenna_delays: dict[int, float] = {}
+        # (initiator, responder) -> responder ticks per initiator tick
+        self._clock_ratios: dict[tuple[int, int], float] = {}
+
+    def configure(
+        self,
+        enabled: bool,
+        time_unit: float,
+        drift_smoothing: float,
+        antenna_delays: dict[int, float],
+    ) -> None:
+        self.enabled = enabled
+        self.time_unit = time_unit
+        self.drift_smoothing = drift_smoothing
+        self.antenna_delays = antenna_delays
+        self._clock_ratios.clear()
+
+    def drift_ppm(self, initiator: int, responder: int) -> float:
+        ratio = self._clock_ratios.get((initiator, responder), 1.0)
+        return (ratio - 1.0) * 1e6
+
+    def distances(
+        self,
+        measurement_type: str,
+        initiator: int,
+        responder: int,
+        round_1: Sequence[float],
+        reply_1: Sequence[float],
+        round_2: Sequence[float],
+        reply_2: Sequence[float],
+    ) -> list[float]:
+        """Distances in metres of the timestamp columns of one link."""
+        link = (initiator, responder)
+        ratio = self._clock_ratios.get(link, 1.0)
+        smoothing = self.drift_smoothing
+        # metres per timestamp unit of a time of flight
+        scale = self.time_unit * SPEED_OF_LIGHT
+        offset = (
+            SPEED_OF_LIGHT
+            / 2
+            * (
+                self.antenna_delays.get(initiator, 0.0)
+                + self.antenna_delays.get(responder, 0.0)
+            )
+        )
+        double_sided = measurement_type != "ss_twr"
+        distances = []
+        for ra, db, rb, da in zip(round_1, reply_1, round_2, reply_2):
+            if rb > 0 and da > 0:
+                # Poll to final spans the same time on both clocks
+                ratio += smoothing * ((rb + db) / (ra + da) - ratio)
+            if double_sided and rb > 0 and da > 0:
+                # asymmetric DS-TWR, the clock drift cancels out
+                tof = (ra * rb - da * db) / (ra + rb + da + db)
+            else:
+                tof = (ra - db / ratio) / 2
+            distances.append(tof * scale - offset)
+        self._clock_ratios[link] = ratio
+        return distances
@@ -0,0 +1,121 @@
+# Standard Library
+import math
+
+from bisect import bisect_right, insort
+
+
+class P2Quantile:
+    """Streaming quantile estimate with the P² algorithm.
+
+    Five markers are kept instead of the samples, every update is O(1).
+    Until five samples were seen the exact quantile of them is returned.
+    """
+
+    __slots__ = ("p", "_heights", "_positions", "_desired", "_increments")
+
+    def __init__(self, p: float) -> None:
+        self.p = p
+        self._heights: list[float] = []
+        self._positions = [1, 2, 3, 4, 5]
+        self._desired = [1.0, 1 + 2 * p, 1 + 4 * p, 3 + 2 * p, 5.0]
+        self._increments = [0.0, p / 2, p, (1 + p) / 2, 1.0]
+
+    def add(self, value: float) -> None:
+        heights = self._heights
+        if len(heights) < 5:
+            insort(heights, value)
+            return
+        if value < heights[0]:
+            heights[0] = value
+            cell = 0
+        elif value >= heights[4]:
+            heights[4] = value
+            cell = 3
+        else:
+            cell = bisect_right(heights, value) - 1
+        positions = self._positions
+        for i in range(cell + 1, 5):
+            positions[i] += 1
+        desired = self._desired
+        for i in range(5):
+            desired[i] += self._increments[i]
+        for i in (1, 2, 3):
+            offset = desired[i] - positions[i]
+            if (offset >= 1 and positions[i + 1] - positions[i] > 1) or (
+                offset <= -1 and positions[i - 1] - positions[i] < -1
+            ):
+                step = 1 if offset > 0 else -1
+                height = self._parabolic(i, step)
+                if not heights[i - 1] < height < heights[i + 1]:
+                    height = heights[i] + step * (
+                        heights[i + step] - heights[i]
+                    ) / (positions[i + step] - positions[i])
+                heights[i] = height
+                positions[i] += step
+
+    def _parabolic(self, i: int, step: int) -> float:
+        heights = self._heights
+        positions = self._positions
+        below = positions[i] - positions[i - 1]
+        above = positions[i + 1] - positions[i]
+        return heights[i] + step / (positions[i + 1] - positions[i - 1]) * (
+            (below + step) * (heights[i + 1] - heights[i]) / above
+            + (above - step) * (heights[i] - heights[i - 1]) / below
+        )
+
+    @property
+    def value(self) -> float | None:
+        heights = self._heights
+        if not heights:
+            return None
+        if len(heights) < 5:
+            return heights[round(self.p * (len(heights) - 1))]
+        return heights[2]
+
+
+class RunningStats:
+    """Count, mean, variance, min, max and quantiles of a stream.
+
+    The mean and variance are updated with Welford's algorithm.
+    """
+
+    __slots__ = ("count", "mean", "_m2", "min", "max", "quantiles")
+
+    def __init__(self, quantiles: tuple[float, ...] = (0.5, 0.9)) -> None:
+        self.count = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+        self.quantiles = [P2Quantile(p) for p in quantiles]
+
+    def add(self, value: float) -> None:
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (value - self.mean)
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+        for quantile in self.quantiles:
+            quantile.add(value)
+
+    @property
+    def variance(self) -> float:
+        return self._m2 / (self.count - 1) if self.count > 1 else 0.0
+
+    def to_dict(self) -> dict:
+        if not self.count:
+            return {"count": 0}
+        return {
+            "count": self.count,
+            "mean": self.mean,
+            "variance": self.variance,
+            "min": self.min,
+            "max": self.max,
+            **{
+                f"p{quantile.p * 100:g}": quantile.value
+                for quantile in self.quantiles
+            },
+        }
@@ -0,0 +1,62 @@
+# Standard Library
+import asyncio
+import logging
+import logging.config
+
+# Library
+from apps.sit_gateway.service_layer.metrics import Metrics
+
+
+LOG_CONFIG_PATH = "settings/logging.conf"
+
+logging.config.fileConfig(LOG_CONFIG_PATH)
+# create logger
+logger = logging.getLogger("main")
+
+
+class MetricsServer:
+    """Serves the metrics as Prometheus text on ``GET /metrics``."""
+
+    def __init__(
+        self, metrics: Metrics, host: str = "127.0.0.1", port: int = 9108
+    ) -> None:
+        self.metrics = metrics
+        self.host = host
+        self.port = port
+
+    async def serve(self):
+        server = await asyncio.start_server(
+            self._handle_request, self.host, self.port
+        )
+        logger.info(f"Metrics on http://{self.host}:{self.port}/metrics")
+        async with server:
+            await server.serve_forever()
+
+    async def _handle_request(self, reader, writer):
+        try:
+            request_line = await reader.readline()
+            # Skip the request headers
+            while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                pass
+            parts = request_line.decode("latin-1").split()
+            if (
+                len(parts) >= 2
+                and parts[0] == "GET"
+                and parts[1] == "/metrics"
+            ):
+                status = "200 OK"
+                body = self.metrics.render().encode("utf-8")
+            else:
+                status = "404 Not Found"
+                body = b"Not Found\n"
+            writer.write(
+                f"HTTP/1.1 {status}\r\n"
+                "Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                "Connection: close\r\n\r\n".encode("latin-1") + body
+            )
+            await writer.drain()
+        except ConnectionError as e:
+            logger.debug(f"Metrics request failed: {e}")
+        finally:
+            writer.close()
@@ -0,0 +1,147 @@
+# Standard Library
+import asyncio
+import logging
+import logging.config
+
+from collections import deque
+from typing import Callable
+
+# Library
+from apps.sit_gateway.adapter.spool import Spool
+
+
+LOG_CONFIG_PATH = "settings/logging.conf"
+
+logging.config.fileConfig(LOG_CONFIG_PATH)
+# create logger
+logger = logging.getLogger("pi_socket")
+
+BLOCK = "block"
+DROP_OLDEST = "drop_oldest"
+SPILL = "spill"
+
+OVERFLOW_POLICIES = (BLOCK, DROP_OLDEST, SPILL)
+
+
+class UplinkQueue:
+    """Bounded frame queue between the message handlers and the websocket.
+
+    Frames are queued with an optional latency trace for the sender.
+    Producers only wait on a full queue with the ``block`` policy,
+    ``drop_oldest`` discards the oldest queued frame and ``spill`` writes
+    the frame to the spool. Spooled frames, also those written while the
+    websocket is down, are replayed in order alternating with live frames.
+    ``spool_frame`` turns a frame into the form it is spooled in.
+    ``run_checkpoints()`` persists the spool in the background.
+    """
+
+    def __init__(
+        self,
+        maxsize: int = 4096,
+        policy: str = BLOCK,
+        spool: Spool | None = None,
+        replay_chunk: int = 256,
+    ) -> None:
+        if policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy: {policy}")
+        if policy == SPILL and spool is None:
+            raise ValueError("The spill policy needs a spool")
+        self.maxsize = maxsize
+        self.policy = policy
+        self.spool = spool
+        self.replay_chunk = replay_chunk
+        self.spool_frame: Callable[[str | bytes], str | bytes] | None = None
+
+        self._frames: deque = deque()
+        self._replay: deque = deque()
+        self._replay_turn = False
+        self._not_empty = asyncio.Event()
+        self._not_full = asyncio.Event()
+        self._not_full.set()
+
+        self.max_depth = 0
+        self.sent = 0
+        self.dropped = 0
+        self.spilled = 0
+
+    @property
+    def depth(self) -> int:
+        return len(self._frames)
+
+    def stats(self) -> dict:
+        stats = {
+            "depth": self.depth,
+            "max_depth": self.max_depth,
+            "sent": self.sent,
+            "dropped": self.dropped,
+            "spilled": self.spilled,
+        }
+        if self.spool is not None:
+            stats["spool"] = self.spool.stats()
+        return stats
+
+    async def put(self, frame: str | bytes, trace: tuple | None = None):
+        while len(self._frames) >= self.maxsize:
+            if self.policy == DROP_OLDEST:
+                self._frames.popleft()
+                self.dropped += 1
+            elif self.policy == SPILL:
+                self.spill(frame)
+                return
+            else:
+                self._not_full.clear()
+                await self._not_full.wait()
+        self._frames.append((frame, trace))
+        self.max_depth = max(self.max_depth, len(self._frames))
+        self._not_empty.set()
+
+    def spill(self, frame: str | bytes) -> bool:
+        """Write the frame to the spool, False if there is none."""
+        if self.spool is None:
+            return False
+        if self.spool_frame is not None:
+            frame = self.spool_frame(frame)
+        self.spool.append(frame)
+        self.spilled += 1
+        self._not_empty.set()
+        return True
+
+    def requeue(self, frame: str | bytes, trace: tuple | None = None):
+        """Put back a frame the sender could not deliver."""
+        self._frames.appendleft((frame, trace))
+        self._not_empty.set()
+
+    async def get(self) -> tuple[str | bytes, tuple | None]:
+        while True:
+            if not self._replay and self.spool is not None:
+                # The sender is done with the frames read before
+                self.spool.commit()
+                if self.spool.has_pending:
+                    self._replay.extend(self.spool.read(self.replay_chunk))
+                    logger.debug(f"Replay {len(self._replay)} spooled frames")
+            # Alternate replayed and live frames, so neither waits
+            if self._replay and (self._replay_turn or not self._frames):
+                self._replay_turn = False
+                return self._replay.popleft(), None
+            if self._frames:
+                self._replay_turn = bool(self._replay)
+                item = self._frames.popleft()
+                if len(self._frames) < self.maxsize:
+                    self._not_full.set()
+                return item
+            self._not_empty.clear()
+            await self._not_empty.wait()
+
+    async def run_checkpoints(self) -> None:
+        """Checkpoint the spool every ``fsync_interval`` seconds."""
+        if self.spool is None:
+            return
+        while True:
+            await asyncio.sleep(self.spool.fsync_interval)
+            try:
+                await self.spool.checkpoint()
+            except OSError as e:
+                logger.error(f"Spool checkpoint failed: {e!r}")
+
+    def task_done(self) -> None:
+        self.sent += 1
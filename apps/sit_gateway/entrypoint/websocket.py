@@ -1,4 +1,5 @@
 # Standard Library
+import asyncio
 import importlib.util
 import json
 import logging
@@ -10,6 +11,9 @@ import websockets.client
 
 # Library
 from apps.sit_gateway.domain import commands, events
+from apps.sit_gateway.entrypoint import wire
+from apps.sit_gateway.entrypoint.uplink import UplinkQueue
+from apps.sit_gateway.service_layer.tracing import LatencyTracker, now
 
 
 LOG_CONFIG_PATH = "settings/logging.conf"
@@ -31,11 +35,19 @@ class Websocket:
         # host: str = "ws://192.168.137.1:8000/",
         # host: str = "ws://192.168.56.1:8000/",
         path: str = "ws/sit/1",
+        uplink: UplinkQueue | None = None,
     ) -> None:
         # self._auth = Authenticator()
         # self._auth.login()
         self._uri = host + path
         self.dataclasses = self.find_dataclasses_in_directory()
+        self.uplink = uplink if uplink is not None else UplinkQueue()
+        self._connected = asyncio.Event()
+        self.encoding = wire.JSON
+        self.wire = wire.WireEncoder()
+        # Spooled frames are replayed after a restart with new link ids
+        self.uplink.spool_frame = self.wire.to_json
+        self.latency = LatencyTracker()
 
     async def connect(self, bus):
         logger.debug(f"Try Connected to: {self._uri}")
@@ -43,6 +55,11 @@ class Websocket:
 
             self._websocket = _websocket
             await bus.handle(commands.RegisterWsClient("PI_Home"))
+            if self.encoding == wire.BINARY:
+                # Announce the links again for the new connection
+                for link_frame in self.wire.link_frames():
+                    await self.send_direct(link_frame)
+            self._connected.set()
             try:
                 # Process messages received on the connection.
                 async for text_data in self._websocket:
@@ -56,6 +73,8 @@ class Websocket:
                 logger.warning(e)
                 logger.warning("Connection is closed, try reconnect")
                 continue
+            finally:
+                self._connected.clear()
 
     async def recive(self, data_msg, bus):
         data = json.loads(data_msg)
@@ -74,13 +93,86 @@ class Websocket:
                     ),
                 )
             ):
-                await bus.handle(message)
+                # Don't block receiving while a command is running
+                await bus.submit(message)
         except ValueError as e:
             logger.debug(f"Can not create Dataclass: {e}")
 
-    async def send(self, data_msg):
+    async def send(self, data_msg, trace: tuple | None = None):
+        # Keep frames on disk while the connection is down
+        if not self._connected.is_set() and self.uplink.spill(data_msg):
+            return
+        await self.uplink.put(data_msg, trace)
+
+    async def send_batch(
+        self,
+        frame_type: str,
+        header: dict,
+        columns: dict[str, list],
+        trace: tuple | None = None,
+    ):
+        """Send the columns in the negotiated encoding.
+
+        ``trace`` holds the receive, decode and handler start time of
+        the oldest record, the serialize time is added here.
+        """
+        if self.encoding == wire.BINARY and self.wire.supports(frame_type):
+            link_id, link_frame = self.wire.link_id(frame_type, header)
+            if link_frame is not None and self._connected.is_set():
+                # Ahead of the queue, so the definition can't be dropped,
+                # spilled or overtaken. connect() sends all definitions
+                # again on a new connection.
+                try:
+                    await self.send_direct(link_frame)
+                except (websockets.ConnectionClosed, OSError) as e:
+                    logger.warning(f"Link definition not sent: {e!r}")
+            data_msg = self.wire.encode(frame_type, link_id, columns)
+        else:
+            message = {"type": frame_type, "data": {**header, **columns}}
+            data_msg = json.dumps(message)
+        if trace is not None:
+            trace = (*trace, now())
+        await self.send(data_msg, trace)
+
+    def set_encoding(self, encoding: str) -> None:
+        if encoding not in wire.ENCODINGS:
+            logger.warning(f"Unknown uplink encoding {encoding}, use json")
+            encoding = wire.JSON
+        self.encoding = encoding
+
+    async def send_direct(self, data_msg):
+        """Send without queueing, e.g. to register before queued frames."""
         await self._websocket.send(data_msg)
 
+    async def run_sender(self):
+        # Frame that failed once for another reason than the connection
+        failed = None
+        while True:
+            data_msg, trace = await self.uplink.get()
+            await self._connected.wait()
+            websocket = self._websocket
+            try:
+                await websocket.send(data_msg)
+                self.uplink.task_done()
+                if trace is not None:
+                    self.latency.record(trace, now())
+            except (websockets.ConnectionClosed, OSError) as e:
+                logger.warning(f"Uplink connection lost: {e!r}")
+                self.uplink.requeue(data_msg, trace)
+                # Wait for connect() to open a new connection
+                if websocket is self._websocket:
+                    self._connected.clear()
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                if failed is data_msg:
+                    # Retrying won't help, don't block the frames behind
+                    logger.error(f"Dropped an unsendable frame: {e!r}")
+                    self.uplink.dropped += 1
+                    failed = None
+                    continue
+                logger.error(f"Sending a frame failed, retry once: {e!r}")
+                failed = data_msg
+                self.uplink.requeue(data_msg, trace)
+
     def create_dataclass_instance(self, event_type, data):
         data_class = self.dataclasses.get(event_type)
         if data_class:
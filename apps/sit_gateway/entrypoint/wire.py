@@ -0,0 +1,162 @@
+# Standard Library
+import json
+import struct
+
+
+JSON = "json"
+BINARY = "binary-v1"
+
+ENCODINGS = (BINARY, JSON)
+
+VERSION = 1
+
+# version, frame type, link id, record count
+HEADER = struct.Struct("<BBHH")
+# sequence, measurement, distance, time_round_1, time_round_2,
+# time_reply_1, time_reply_2, nlos, rssi, fpi
+RECORD = struct.Struct("<IIfffffHff")
+RECORD_FIELDS = (
+    "sequence",
+    "measurement",
+    "distance",
+    "time_round_1",
+    "time_round_2",
+    "time_reply_1",
+    "time_reply_2",
+    "nlos_final",
+    "rssi_final",
+    "fpi_final",
+)
+
+# Float fields computed on the gateway, appended to every record when
+# their flag is set in the frame type byte
+OPTIONAL_FIELDS = {
+    0x80: ("distance_corrected",),
+    0x40: ("distance_filtered", "quality"),
+}
+FLAGS = 0x80 | 0x40
+
+
+def record_layout(flags: int) -> tuple[struct.Struct, tuple[str, ...]]:
+    fields = RECORD_FIELDS
+    for flag, names in OPTIONAL_FIELDS.items():
+        if flags & flag:
+            fields += names
+    extra = len(fields) - len(RECORD_FIELDS)
+    return struct.Struct(RECORD.format + "f" * extra), fields
+
+
+FRAME_TYPES = {
+    "SaveMeasurementBatch": 1,
+    "SaveTestMeasurementBatch": 2,
+}
+
+
+class WireEncoder:
+    """Encodes measurement batches as fixed layout little endian frames.
+
+    The strings of a batch header are announced once per link with a
+    ``RegisterUplinkLink`` JSON frame, binary frames only carry the
+    link id. Link ids only hold for this process, frames that outlive
+    it are stored in their JSON form, see ``to_json()``.
+    """
+
+    def __init__(self) -> None:
+        self.links: dict[tuple, int] = {}
+        self._definitions: list[str] = []
+        self._layouts: dict[int, tuple] = {}
+        self._decoder = WireDecoder()
+
+    def supports(self, frame_type: str) -> bool:
+        return frame_type in FRAME_TYPES
+
+    def link_frames(self) -> list[str]:
+        """The definitions of all links, also of links defined while the
+        list is iterated."""
+        return self._definitions
+
+    def link_id(self, frame_type: str, header: dict) -> tuple[int, str | None]:
+        """Return the link id and its definition frame if the link is new."""
+        key = (frame_type, *header.values())
+        link_id = self.links.get(key)
+        if link_id is not None:
+            return link_id, None
+        link_id = len(self.links) + 1
+        self.links[key] = link_id
+        definition = json.dumps(
+            {
+                "type": "RegisterUplinkLink",
+                "data": {
+                    "link_id": link_id,
+                    "frame_type": frame_type,
+                    **header,
+                },
+            }
+        )
+        self._definitions.append(definition)
+        self._decoder.decode(definition)
+        return link_id, definition
+
+    def to_json(self, frame: str | bytes) -> str:
+        """The JSON form of a frame, it doesn't depend on the link ids."""
+        if isinstance(frame, str):
+            return frame
+        return json.dumps(self._decoder.decode(frame))
+
+    def encode(
+        self, frame_type: str, link_id: int, columns: dict[str, list]
+    ) -> bytes:
+        flags = 0
+        for flag, names in OPTIONAL_FIELDS.items():
+            if names[0] in columns:
+                flags |= flag
+        layout = self._layouts.get(flags)
+        if layout is None:
+            layout = self._layouts[flags] = record_layout(flags)
+        record, fields = layout
+        rows = list(zip(*(columns[field] for field in fields)))
+        code = FRAME_TYPES[frame_type] | flags
+        return HEADER.pack(VERSION, code, link_id, len(rows)) + b"".join(
+            record.pack(*row) for row in rows
+        )
+
+
+class WireDecoder:
+    """Reference decoder for the receiving side of the uplink.
+
+    Feed every frame of a connection in order, link definitions are
+    remembered and binary frames are returned in their JSON form.
+    """
+
+    def __init__(self) -> None:
+        self.links: dict[int, dict] = {}
+        self._frame_types = {code: name for name, code in FRAME_TYPES.items()}
+
+    def decode(self, frame: str | bytes) -> dict | None:
+        if isinstance(frame, str):
+            message = json.loads(frame)
+            if message["type"] == "RegisterUplinkLink":
+                data = dict(message["data"])
+                self.links[data.pop("link_id")] = data
+                return None
+            return message
+
+        version, frame_type, link_id, count = HEADER.unpack_from(frame)
+        if version != VERSION:
+            raise ValueError(f"Unsupported wire version: {version}")
+        record, fields = record_layout(frame_type & FLAGS)
+        frame_type &= ~FLAGS
+        if len(frame) != HEADER.size + count * record.size:
+            raise ValueError(f"Frame length not correct: {len(frame)}")
+        header = dict(self.links[link_id])
+        if header.pop("frame_type") != self._frame_types[frame_type]:
+            raise ValueError(f"Link {link_id} has another frame type")
+        records = record.iter_unpack(memoryview(frame)[HEADER.size :])
+        columns: dict[str, list] = {field: [] for field in fields}
+        for values in records:
+            for field, value in zip(fields, values):
+                columns[field].append(value)
+        return {
+            "type": self._frame_types[frame_type],
+            "data": {**header, **columns},
+        }
@@ -1,12 +1,10 @@
 # Standard Library
 import asyncio
-import json
 import logging
 import logging.config
 
-from cgi import test
 from itertools import permutations
-from turtle import distance
+from typing import Sequence
 
 # Third Party
 from bleak import BleakScanner
@@ -15,10 +13,26 @@ from bleak.exc import BleakError
 
 # Library
 from apps.sit_gateway.domain import commands, events
-from apps.sit_gateway.domain.data import MsgData, SimpleMsgData
+from apps.sit_gateway.domain.calibration import (
+    calibration_params,
+    plan_waves,
+)
+from apps.sit_gateway.domain.data import (
+    MeasurementRing,
+    MsgData,
+    MsgDataBatch,
+    SimpleMsgData,
+)
+from apps.sit_gateway.domain.devices import DeviceTable
+from apps.sit_gateway.domain.filtering import MeasurementFilter
+from apps.sit_gateway.domain.joining import ExchangeJoiner
+from apps.sit_gateway.domain.positioning import PositionEngine
+from apps.sit_gateway.domain.ranging import RangingEstimator
 from apps.sit_gateway.service_layer.utils import cancel_task
 
+from .adapter import command_codec
 from .adapter.ble import Ble
+from .adapter.scanner import BackgroundScanner, DeviceRegistry
 
 
 LOG_CONFIG_PATH = "settings/logging.conf"
@@ -27,10 +41,26 @@ logging.config.fileConfig(LOG_CONFIG_PATH)
 # create logger
 logger = logging.getLogger("sit_gateway")
 
+# Record fields the ranging and filter stages read
+GATEWAY_INPUTS = (
+    "distance",
+    "time_round_1",
+    "time_reply_1",
+    "time_round_2",
+    "time_reply_2",
+    "nlos",
+    "rssi",
+    "fpi",
+)
+
 
 class SITGateway:
-    def __init__(self) -> None:
-        self.ble_list: list[Ble] = []
+    def __init__(self, measurement_capacity: int = 4096) -> None:
+        self.devices = DeviceTable()
+        # (initiator link id, responder link id) -> batched records of the
+        # link, the columns of the batch events are views on them
+        self.measurements: dict[tuple[int, int], MeasurementRing] = {}
+        self.measurement_capacity = measurement_capacity
 
         self.test_id: int = 0
         self.calibration_id: int = 0
@@ -38,31 +68,57 @@ class SITGateway:
         self.measurement_type = "ss_twr"
         self.initiator_device: str
         self.responder_devices: list[str]
+        self.initiator_link: int
+        self.responder_links: list[int]
         self.cali_device_list: list[str]
+        self.cali_waves: list[list[list[str]]] = []
+        # link id -> devices of its running calibration round
+        self.cali_active: dict[int, list[str]] = {}
+        # round -> [records, sum of the distances]
+        self.cali_results: dict[tuple[str, ...], list] = {}
+        self.cali_params = ""
+        # Send every calibration record, else only the solved delays
+        self.cali_raw_stream = True
+        # Rounds of initiator/responder pairs, the antenna delays are
+        # solved from them, else rounds of three devices
+        self.cali_pairs = False
         self.is_running = False
 
+        # device id -> (command encoding, write without response)
+        self.command_encodings: dict[str, tuple[str, bool]] = {}
+
+        self.ranging = RangingEstimator()
+        self.filter = MeasurementFilter()
+        self.positions = PositionEngine()
+        self.joiner = ExchangeJoiner()
+
+        self.registry = DeviceRegistry()
+        self.scanner = BackgroundScanner(self.registry)
+
     def set_dependencies(self, tg, bus):
         self.task_group = tg
         self.bus = bus
+        self.task_group.create_task(
+            self.scanner.run(), name="Ble Scanner Task"
+        )
 
     async def cleanup(self):
-        for device in self.ble_list:
+        for device in self.devices:
             await device.cleanup()
-        self.ble_list.clear()
+        self.devices.clear()
         for task in asyncio.all_tasks():
             if "Ble Task " in task.get_name():
                 task.cancel()
                 return None
 
     # Bluetooth Connection Manager
-    async def start_ble_gateway(self, device_id: str) -> None:
+    async def start_ble_gateway(
+        self, device_id: str, timeout: float = 30.0
+    ) -> None:
         ble = await self.connect_ble(device_name=device_id)
-        await asyncio.sleep(5.0)
         if ble is not None:
-            await asyncio.sleep(5.0)
-            # TODO
-            if ble.is_connected():
-                self.ble_list.append(ble)
+            if await ble.wait_connected(timeout):
+                self.devices.add(device_id, ble.get_device_address(), ble)
                 await self.bus.handle(
                     events.BleDeviceConnected(device_id=device_id)
                 )
@@ -80,11 +136,38 @@ class SITGateway:
                 )
             )
 
+    async def start_ble_gateways(
+        self, device_ids: list[str], concurrency: int = 4
+    ) -> None:
+        """Connect the devices concurrently, at most ``concurrency`` at once.
+
+        Every device reports its own connected or failed event as soon as
+        its connect attempt finished.
+        """
+        device_ids = list(dict.fromkeys(device_ids))
+        semaphore = asyncio.Semaphore(max(1, concurrency))
+
+        async def start(device_id: str):
+            async with semaphore:
+                await self.start_ble_gateway(device_id)
+
+        results = await asyncio.gather(
+            *(start(device_id) for device_id in device_ids),
+            return_exceptions=True,
+        )
+        for device_id, result in zip(device_ids, results):
+            if isinstance(result, Exception):
+                logger.error(f"Connecting {device_id} failed: {result}")
+                await self.bus.handle(
+                    events.BleDeviceConnectError(
+                        device_id=device_id, reason=str(result)
+                    )
+                )
+
     async def stop_ble_gateway(self, device_id) -> None:
-        index = self.get_device_index(device_id)
-        if index is not None:
-            ble = self.ble_list.pop(index)
-            await ble.cleanup()
+        link = self.devices.remove(device_id)
+        if link is not None:
+            await link.device.cleanup()
             cancel_task("Ble Task " + device_id)
         await self.bus.handle(
             events.BleDeviceDisconnected(device_id=device_id)
@@ -94,24 +177,45 @@ class SITGateway:
         _scanner = BleakScanner()
         return await _scanner.discover(timeout=timeout)
 
-    async def connect_ble(self, device_name) -> Ble | None:
-        devices = await self.scan(20)
-        for device in devices:
-            if device_name in device.name:
-                ble = Ble(self)
-                logger.info(f"{device.name}: {device.address}")
-                logger.info(f"UUIDs: {device.metadata['uuids']}")
-                task_name = (
-                    "Ble Task " + device_name
-                )  # BLE TASK with Device Name to identify the Task
-                self.task_group.create_task(
-                    ble.connect_device(device),
-                    name=task_name,
-                )
-                await asyncio.sleep(2.0)
-                return ble
+    async def find_ble_device(
+        self, device_name: str, timeout: float = 20.0
+    ) -> BLEDevice | None:
+        seen = self.registry.find(device_name)
+        if seen is not None:
+            logger.info(f"UUIDs: {seen.uuids}, RSSI: {seen.rssi}")
+            return seen.device
+        # Reconnect by the cached address, BlueZ still knows the device
+        known = self.registry.known(device_name)
+        if known is not None:
+            return known
+        if self.scanner.is_running:
+            seen = await self.registry.wait_for(device_name, timeout)
+            return seen.device if seen is not None else None
+        for device in await self.scan(timeout):
+            if device.name == device_name:
+                return device
         return None
 
+    async def connect_ble(self, device_name) -> Ble | None:
+        device = await self.find_ble_device(device_name)
+        if device is None:
+            return None
+        ble = Ble(self, link_id=self.devices.intern(device_name))
+        encoding, write_without_response = self.command_encodings.get(
+            device_name, (command_codec.JSON, False)
+        )
+        ble.command_encoding = encoding
+        ble.write_without_response = write_without_response
+        logger.info(f"{device.name}: {device.address}")
+        task_name = (
+            "Ble Task " + device_name
+        )  # BLE TASK with Device Name to identify the Task
+        self.task_group.create_task(
+            ble.connect_device(device),
+            name=task_name,
+        )
+        return ble
+
     async def start_measurement(
         self,
         initiator_device: str,
@@ -121,6 +225,10 @@ class SITGateway:
         self.test_id = test_id
         self.initiator_device = initiator_device
         self.responder_devices = responder_devices
+        self.initiator_link = self.devices.intern(initiator_device)
+        self.responder_links = [
+            self.devices.intern(responder) for responder in responder_devices
+        ]
 
         command = {"type": "measurement_msg", "command": "start"}
         for responder in self.responder_devices:
@@ -131,14 +239,9 @@ class SITGateway:
             "6ba1de6b-3ab6-4d77-9ea1-cb6422720003", command, initiator_device
         )
 
-        self.task_group.create_task(
-            self.enable_notify(initiator_device),
-            name="BLE Notify" + initiator_device,
-        )
+        await self.enable_notify(initiator_device)
         for responder in responder_devices:
-            self.task_group.create_task(
-                self.enable_notify(responder), name="BLE Notify" + responder
-            )
+            await self.enable_notify(responder)
         self.is_running = True
 
     async def stop_measurement(self):
@@ -147,16 +250,22 @@ class SITGateway:
             await self.ble_send_json(
                 "6ba1de6b-3ab6-4d77-9ea1-cb6422720003", command, responder
             )
-            cancel_task("BLE Notify" + responder)
+            await self.disable_notify(responder)
         await self.ble_send_json(
             "6ba1de6b-3ab6-4d77-9ea1-cb6422720003",
             command,
             self.initiator_device,
         )
-        cancel_task("BLE Notify" + self.initiator_device)
+        await self.disable_notify(self.initiator_device)
+        self.joiner.clear()
 
         self.is_running = False
 
+    async def start_cali_wave(self, wave: list[list[str]]):
+        await asyncio.gather(
+            *(self.start_cali_measurement(devices) for devices in wave)
+        )
+
     async def start_cali_measurement(self, devices):
         command = {"type": "measurement_msg", "command": "start"}
         for device in devices:
@@ -165,53 +274,92 @@ class SITGateway:
                 command,
                 device,
             )
-            self.task_group.create_task(
-                self.enable_notify(device),
-                name="BLE Notify" + device,
-            )
+            await self.enable_notify(device)
             await asyncio.sleep(0.5)
 
-    async def stop_cali_measurement(self):
+    async def stop_cali_measurement(self, devices):
         command = {"type": "measurement_msg", "command": "stop"}
-        for device in reversed(self.actuale_cali_devices):
+        for device in reversed(devices):
             await self.ble_send_json(
                 "6ba1de6b-3ab6-4d77-9ea1-cb6422720003", command, device
             )
-            cancel_task("BLE Notify" + device)
-        self.is_running = False
+            await self.disable_notify(device)
 
-    async def enable_notify(self, initiator_device):
-        enable_notify = False
-        device = self.get_device(initiator_device)
-        while 1:
-            if device.is_connected() and not enable_notify:
-                await device.get_notification(
-                    "6ba1de6b-3ab6-4d77-9ea1-cb6422720001",
-                    self.distance_notifcation,
-                )
-                enable_notify = True
-            await asyncio.sleep(2)
+    async def finish_cali_round(self, devices: list[str]):
+        """Stop a round, the next wave starts once its last round ended."""
+        count, distance = self.cali_results.pop(tuple(devices), (0, 0.0))
+        await self.bus.handle(
+            events.CalibrationRoundFinished(
+                calibration_id=self.calibration_id,
+                params=self.cali_params,
+                devices=devices,
+                measurements=count,
+                mean_distance=distance / count if count else None,
+            )
+        )
+        for device in devices:
+            self.cali_active.pop(self.devices.intern(device), None)
+        await self.stop_cali_measurement(devices)
+        if not self.cali_active:
+            self.is_running = False
+            await self.bus.handle(commands.StartSingleCalibrationMeasurement())
+
+    async def enable_notify(self, device_name: str):
+        # The Ble arms the notification as soon as its link is up
+        # and again after every reconnect
+        device = self.get_device(device_name)
+        if device is None:
+            logger.error(f"Can't notify, {device_name} is not connected")
+            return
+        try:
+            await device.get_notification(
+                "6ba1de6b-3ab6-4d77-9ea1-cb6422720001",
+                self.distance_notifcation,
+            )
+        except BleakError as e:
+            logger.error(f"Can't enable notify: {e}")
+
+    async def disable_notify(self, device_name: str):
+        device = self.get_device(device_name)
+        if device is None:
+            return
+        try:
+            await device.stop_notification(
+                "6ba1de6b-3ab6-4d77-9ea1-cb6422720001"
+            )
+        except BleakError as e:
+            logger.error(f"Can't disable notify: {e}")
 
     async def distance_notifcation(
-        self, data: MsgData | SimpleMsgData, device: str
+        self, data: MsgData | MsgDataBatch | SimpleMsgData, link: int
     ):
-        if isinstance(data, MsgData):
+        if isinstance(data, MsgDataBatch):
+            await self.distance_batch_notification(data, link)
+        elif isinstance(data, MsgData):
             # Not a good option but when get full data msg
             # the response
             # from device the id is always 8292
             # so find an option to change this
+            # The joiner takes the responder from its half of the exchange
 
-            if self.measurement_type == "ss_twr":
-                responder = self.responder_devices[0]
+            if self.joiner.enabled and self.calibration_id == 0:
+                joined = self.joiner.add(
+                    link, link == self.initiator_link, data
+                )
+                if joined is None:
+                    return
+                responder, data = joined
+            elif self.measurement_type == "ss_twr":
+                responder = self.responder_links[0]
             else:
-                responder = device
+                responder = link
 
-            if self.test_id != 0:
+            if self.test_id:
                 await self.bus.handle(
                     events.TestMeasurement(
                         test_id=self.test_id,
                         initiator=self.initiator_device,
-                        responder=responder,
+                        responder=self.devices.name(responder),
                         measurement_type=self.measurement_type,
                         sequence=data.sequence,
                         measurement=data.measurement,
@@ -223,6 +371,11 @@ class SITGateway:
                         nlos=data.nlos,
                         rssi=data.rssi,
                         fpi=data.fpi,
+                        received_at=data.received_at,
+                        decoded_at=data.decoded_at,
+                        initiator_id=self.initiator_link,
+                        responder_id=responder,
+                        **self.gateway_fields(data, responder),
                     )
                 )
                 if self.test_setup["max_measurement"] - 1 == data.measurement:
@@ -233,30 +386,38 @@ class SITGateway:
                     self.test_id = None
 
             elif self.calibration_id != 0:
-                await self.bus.handle(
-                    events.SimpleCalibrationMeasurement(
-                        calibration_id=self.calibration_id,
-                        sequence=data.sequence,
-                        measurement=data.measurement,
-                        devices=self.actuale_cali_devices,
-                        time_reply_1=data.time_reply_1,
-                        time_reply_2=data.time_reply_2,
-                        time_round_1=data.time_round_1,
-                        time_round_2=data.time_round_2,
-                        distance=data.distance,
-                    )
-                )
-                if self.cali_setup["max_measurement"] - 1 == data.measurement:
-                    await self.stop_cali_measurement()
+                cali_devices = self.cali_active.get(link)
+                if cali_devices is None:
+                    # late record of a round that already finished
+                    return
+                self.add_cali_result(cali_devices, data.distance)
+                if self.cali_raw_stream:
                     await self.bus.handle(
-                        commands.StartSingleCalibrationMeasurement()
+                        events.SimpleCalibrationMeasurement(
+                            calibration_id=self.calibration_id,
+                            sequence=data.sequence,
+                            measurement=data.measurement,
+                            devices=cali_devices,
+                            time_reply_1=data.time_reply_1,
+                            time_reply_2=data.time_reply_2,
+                            time_round_1=data.time_round_1,
+                            time_round_2=data.time_round_2,
+                            distance=data.distance,
+                        )
                     )
+                if self.cali_setup["max_measurement"] - 1 == data.measurement:
+                    await self.finish_cali_round(cali_devices)
             else:
                 logger.debug(f"Data: {data}")
+                extra = self.gateway_fields(data, responder)
+                if self.positions.enabled:
+                    await self.update_position(responder, data.distance, extra)
+                    if not self.positions.forward_distances:
+                        return
                 await self.bus.handle(
                     events.DistanceMeasurement(
                         initiator=self.initiator_device,
-                        responder=responder,
+                        responder=self.devices.name(responder),
                         measurement_type=self.measurement_type,
                         sequence=data.sequence,
                         measurement=data.measurement,
@@ -268,43 +429,170 @@ class SITGateway:
                         nlos=data.nlos,
                         rssi=data.rssi,
                         fpi=data.fpi,
+                        received_at=data.received_at,
+                        decoded_at=data.decoded_at,
+                        initiator_id=self.initiator_link,
+                        responder_id=responder,
+                        **extra,
                     )
                 )
         else:
-            await self.bus.handle(
-                events.SimpleCalibrationMeasurement(
-                    calibration_id=self.calibration_id,
-                    sequence=data.sequence,
-                    measurement=data.measurement,
-                    devices=self.actuale_cali_devices,
-                    time_m21=data.time_m21,
-                    time_m31=data.time_m31,
-                    time_a21=data.time_a21,
-                    time_a31=data.time_a31,
-                    time_b21=data.time_b21,
-                    time_b31=data.time_b31,
-                    time_tc_i=data.time_tc_i,
-                    time_tc_ii=data.time_tc_ii,
-                    time_tb_i=data.time_tb_i,
-                    time_tb_ii=data.time_tb_ii,
-                    time_reply_1=data.time_reply_1,
-                    time_reply_2=data.time_reply_2,
-                    time_round_1=data.time_round_1,
-                    time_round_2=data.time_round_2,
-                    distance=data.distance,
+            cali_devices = self.cali_active.get(link)
+            if cali_devices is None:
+                return
+            self.add_cali_result(cali_devices, data.distance)
+            if self.cali_raw_stream:
+                await self.bus.handle(
+                    events.SimpleCalibrationMeasurement(
+                        calibration_id=self.calibration_id,
+                        sequence=data.sequence,
+                        measurement=data.measurement,
+                        devices=cali_devices,
+                        time_m21=data.time_m21,
+                        time_m31=data.time_m31,
+                        time_a21=data.time_a21,
+                        time_a31=data.time_a31,
+                        time_b21=data.time_b21,
+                        time_b31=data.time_b31,
+                        time_tc_i=data.time_tc_i,
+                        time_tc_ii=data.time_tc_ii,
+                        time_tb_i=data.time_tb_i,
+                        time_tb_ii=data.time_tb_ii,
+                        time_reply_1=data.time_reply_1,
+                        time_reply_2=data.time_reply_2,
+                        time_round_1=data.time_round_1,
+                        time_round_2=data.time_round_2,
+                        distance=data.distance,
+                    )
                 )
-            )
             if self.cali_setup["max_measurement"] - 1 == data.measurement:
-                await self.stop_cali_measurement()
-                await self.bus.handle(
-                    commands.StartSingleCalibrationMeasurement()
+                await self.finish_cali_round(cali_devices)
+
+    def gateway_columns(
+        self, responder: int, columns: dict[str, Sequence]
+    ) -> dict[str, list]:
+        """Corrected and filtered distances of the records of a link.
+
+        Only the enabled stages add their columns, the filter works on
+        the corrected distances if there are any.
+        """
+        result = {}
+        distance = columns["distance"]
+        if self.ranging.enabled:
+            distance = result["distance_corrected"] = self.ranging.distances(
+                self.measurement_type,
+                self.initiator_link,
+                responder,
+                columns["time_round_1"],
+                columns["time_reply_1"],
+                columns["time_round_2"],
+                columns["time_reply_2"],
+            )
+        if self.filter.enabled:
+            filtered, quality = self.filter.apply(
+                (self.initiator_link, responder),
+                distance,
+                columns["nlos"],
+                columns["rssi"],
+                columns["fpi"],
+            )
+            result["distance_filtered"] = filtered
+            result["quality"] = quality
+        return result
+
+    def gateway_fields(self, data: MsgData, responder: int) -> dict:
+        if not (self.ranging.enabled or self.filter.enabled):
+            return {}
+        columns = {name: (getattr(data, name),) for name in GATEWAY_INPUTS}
+        return {
+            name: values[0]
+            for name, values in self.gateway_columns(
+                responder, columns
+            ).items()
+        }
+
+    async def update_position(
+        self, responder: int, distance: float, extra: dict
+    ) -> None:
+        """Feed the best distance of a record to the position engine."""
+        distance = extra.get(
+            "distance_filtered", extra.get("distance_corrected", distance)
+        )
+        fix = self.positions.add(
+            self.initiator_device,
+            self.devices.name(responder),
+            distance,
+            extra.get("quality", 1.0),
+        )
+        if fix is not None:
+            await self.bus.handle(
+                events.PositionMeasurement(
+                    tag=fix.tag,
+                    position=fix.position,
+                    anchors=fix.anchors,
+                    rms_m=fix.rms_m,
+                    timestamp=fix.timestamp,
                 )
+            )
+
+    async def distance_batch_notification(self, data: MsgDataBatch, link: int):
+        # Tests and calibrations stop after a number of measurements and
+        # joined records are merged one by one, so these records keep
+        # the per record path
+        if self.test_id or self.calibration_id != 0 or self.joiner.enabled:
+            for msg_data in data.rows():
+                await self.distance_notifcation(msg_data, link)
+            return
+
+        if self.measurement_type == "ss_twr":
+            responder = self.responder_links[0]
+        else:
+            responder = link
+
+        records = self.link_measurements(
+            self.initiator_link, responder
+        ).extend(data)
+        extra = {}
+        if self.ranging.enabled or self.filter.enabled:
+            extra = self.gateway_columns(
+                responder,
+                {name: records.column(name) for name in GATEWAY_INPUTS},
+            )
+        if self.positions.enabled and len(records):
+            # the newest record of the batch is the current distance
+            await self.update_position(
+                responder,
+                records.column("distance")[-1],
+                {name: values[-1] for name, values in extra.items()},
+            )
+            if not self.positions.forward_distances:
+                return
+        await self.bus.handle(
+            events.DistanceMeasurementBatch(
+                initiator=self.initiator_device,
+                responder=self.devices.name(responder),
+                measurement_type=self.measurement_type,
+                records=records,
+                received_at=data.received_at,
+                decoded_at=data.decoded_at,
+                initiator_id=self.initiator_link,
+                responder_id=responder,
+                **extra,
+            )
+        )
 
     async def setup_calibration(
         self,
         calibration_setup: commands.StartCalibrationMeasurement,
+        cached: set[tuple[str, ...]] = frozenset(),
     ):
         self.calibration_id = calibration_setup.calibration_id
+        self.cali_params = calibration_params(calibration_setup)
+        self.cali_pairs = True
+        # Without true distances no delays are solved to send instead
+        self.cali_raw_stream = calibration_setup.raw_stream or not (
+            calibration_setup.reference_distance or calibration_setup.distances
+        )
         self.cali_device_list = []
         for initiator_device in calibration_setup.devices:
             for responder_device in calibration_setup.devices:
@@ -312,9 +600,11 @@ class SITGateway:
                     self.cali_device_list.append(
                         [initiator_device, responder_device]
                     )
+        skipped = self.skip_cached_rounds(cached)
 
         self.cali_finished_list = []
         self.cali_rounds = len(self.cali_device_list)
+        await self.plan_calibration(calibration_setup.max_radios, skipped)
 
         self.cali_setup = {
             "type": "setup_msg",
@@ -334,7 +624,14 @@ class SITGateway:
     async def setup_test(
         self,
         test_setup: commands.StartTestMeasurement,
+        min_measurement: int = 0,
+        antenna_delays: dict[str, dict] | None = None,
     ):
+        """``min_measurement`` is only set to resume an interrupted test.
+
+        ``antenna_delays`` are the calibrated delays per device, used for
+        the delays the command leaves at 0.
+        """
         self.test_id = test_setup.test_id
         self.test_setup = {
             "type": "setup_msg",
@@ -343,58 +640,78 @@ class SITGateway:
             "initiator": 1,
             "responder_device": test_setup.responder,
             "responder": 1,
-            "min_measurement": 0,
+            "min_measurement": min_measurement,
             "max_measurement": test_setup.max_measurement,
             "measurement_type": test_setup.measurement_type,
         }
         await self.set_measurement_type(test_setup.measurement_type)
+        antenna_delays = antenna_delays or {}
+        messages = {
+            responder: {
+                **self.test_setup,
+                "device_type": "responder",
+                **self.test_delays(
+                    test_setup.resp_rx_ant_dly,
+                    test_setup.resp_tx_ant_dly,
+                    antenna_delays.get(responder, {}),
+                ),
+            }
+            for responder in test_setup.responder
+        }
         self.test_setup["device_type"] = "initiator"
-        self.test_setup["rx_ant_dly"] = int(
-            (test_setup.init_rx_ant_dly / 1.026e-6) * 63898
-        )
-        self.test_setup["tx_ant_dly"] = int(
-            (test_setup.init_tx_ant_dly / 1.026e-6) * 63898
+        self.test_setup.update(
+            self.test_delays(
+                test_setup.init_rx_ant_dly,
+                test_setup.init_tx_ant_dly,
+                antenna_delays.get(test_setup.initiator, {}),
+            )
         )
-        await self.ble_send_json(
-            "6ba1de6b-3ab6-4d77-9ea1-cb6422720004",
-            self.test_setup,
-            test_setup.initiator,
+        messages[test_setup.initiator] = self.test_setup
+        missing = await self.ble_fan_out(
+            "6ba1de6b-3ab6-4d77-9ea1-cb6422720004", messages
         )
-        self.test_setup["device_type"] = "responder"
-
-        for responder in test_setup.responder:
-            self.test_setup["rx_ant_dly"] = int(
-                (test_setup.resp_rx_ant_dly / 1.026e-6) * 63898
-            )
-            self.test_setup["tx_ant_dly"] = int(
-                (test_setup.resp_tx_ant_dly / 1.026e-6) * 63898
-            )
-            await self.ble_send_json(
-                "6ba1de6b-3ab6-4d77-9ea1-cb6422720004",
-                self.test_setup,
-                responder,
-            )
-        await asyncio.sleep(3)
+        if missing:
+            # The session stays open, ResumeSession starts it again
+            logger.error(f"Test {test_setup.test_id} not started")
+            self.test_id = None
+            return
         await self.start_measurement(
             initiator_device=test_setup.initiator,
             responder_devices=test_setup.responder,
             test_id=test_setup.test_id,
         )
 
+    def test_delays(
+        self, rx_ant_dly: float, tx_ant_dly: float, calibrated: dict
+    ) -> dict:
+        """Delays in seconds in device units, 0 falls back to calibrated."""
+        return {
+            "rx_ant_dly": int((rx_ant_dly / 1.026e-6) * 63898)
+            or calibrated.get("rx_ant_dly", 0),
+            "tx_ant_dly": int((tx_ant_dly / 1.026e-6) * 63898)
+            or calibrated.get("tx_ant_dly", 0),
+        }
+
     async def setup_simple_calibration(
         self,
         calibration_setup: commands.StartSimpleCalibrationMeasurement,
+        cached: set[tuple[str, ...]] = frozenset(),
     ):
         self.is_running = True
         self.cali_finished_list = []
         self.calibration_id = calibration_setup.calibration_id
+        self.cali_params = calibration_params(calibration_setup)
+        self.cali_pairs = False
+        self.cali_raw_stream = True
 
         self.measurement_type = calibration_setup.measurement_type
 
         self.cali_device_list = list(
             map(list, permutations(calibration_setup.devices, 3))
         )
+        skipped = self.skip_cached_rounds(cached)
         self.cali_rounds = len(self.cali_device_list)
+        await self.plan_calibration(calibration_setup.max_radios, skipped)
         self.cali_setup = {
             "type": "setup_msg",
             "device_type": "",
@@ -412,42 +729,98 @@ class SITGateway:
         await asyncio.sleep(2)
         await self.bus.handle(commands.StartSingleCalibrationMeasurement())
 
+    def skip_cached_rounds(self, cached: set[tuple[str, ...]]) -> int:
+        rounds = len(self.cali_device_list)
+        self.cali_device_list = [
+            devices
+            for devices in self.cali_device_list
+            if tuple(devices) not in cached
+        ]
+        return rounds - len(self.cali_device_list)
+
+    async def plan_calibration(self, max_radios: int = 0, skipped: int = 0):
+        self.cali_waves = plan_waves(self.cali_device_list, max_radios)
+        self.cali_active = {}
+        self.cali_results = {}
+        logger.info(
+            f"Calibration: {self.cali_rounds} rounds "
+            f"in {len(self.cali_waves)} waves, {skipped} cached"
+        )
+        await self.bus.handle(
+            events.CalibrationPlanned(
+                calibration_id=self.calibration_id,
+                rounds=self.cali_rounds,
+                waves=len(self.cali_waves),
+                max_radios=max_radios,
+                skipped=skipped,
+            )
+        )
+
+    def add_cali_result(self, devices: list[str], distance: float):
+        result = self.cali_results.get(tuple(devices))
+        if result is None:
+            result = self.cali_results[tuple(devices)] = [0, 0.0]
+        result[0] += 1
+        result[1] += distance
+
     async def start_simple_calibration(self):
         self.is_running = True
-        if self.cali_rounds > len(self.cali_finished_list):
-            self.actuale_cali_devices = self.cali_device_list.pop(0)
-            for idx, device in enumerate(self.actuale_cali_devices):
-                if idx == 0:
-                    if self.measurement_type == "two_device":
-                        self.cali_setup["device_type"] = "A"
-                    else:
-                        self.cali_setup["device_type"] = "initiator"
-                        self.cali_setup["initiator_device"] = device
-                elif idx == 1:
-                    if self.measurement_type == "two_device":
-                        self.cali_setup["device_type"] = "B"
-                    else:
-                        self.cali_setup["device_type"] = "responder"
-                        self.cali_setup["responder_device"] = [device]
-                elif idx == 2:
-                    self.cali_setup["device_type"] = "C"
-
-                await self.ble_send_json(
-                    "6ba1de6b-3ab6-4d77-9ea1-cb6422720004",
-                    self.cali_setup,
-                    device,
-                )
-                await asyncio.sleep(0.1)
-            self.cali_finished_list.append(self.actuale_cali_devices)
-            await self.start_cali_measurement(self.actuale_cali_devices)
-        else:
-            logger.debug("Calibration Finished")
-            self.is_running = False
-            await self.bus.handle(
-                events.CalibrationSimpleMeasurementFinished(
-                    calibration_id=self.calibration_id
-                )
+        while self.cali_waves:
+            wave = self.cali_waves.pop(0)
+            messages = {}
+            for cali_devices in wave:
+                setup = dict(self.cali_setup)
+                for idx, device in enumerate(cali_devices):
+                    if idx == 0:
+                        if self.measurement_type == "two_device":
+                            setup["device_type"] = "A"
+                        else:
+                            setup["device_type"] = "initiator"
+                            setup["initiator_device"] = device
+                    elif idx == 1:
+                        if self.measurement_type == "two_device":
+                            setup["device_type"] = "B"
+                        else:
+                            setup["device_type"] = "responder"
+                            setup["responder_device"] = [device]
+                    elif idx == 2:
+                        setup["device_type"] = "C"
+                    messages[device] = dict(setup)
+                    self.cali_active[
+                        self.devices.intern(device)
+                    ] = cali_devices
+            missing = await self.ble_fan_out(
+                "6ba1de6b-3ab6-4d77-9ea1-cb6422720004", messages
             )
+            # A round with a device that isn't set up would never send
+            # its last record and hold up the wave. It isn't stored as
+            # finished, an incremental calibration runs it again.
+            wave = self.skip_failed_rounds(wave, missing)
+            if wave:
+                self.cali_finished_list.extend(wave)
+                await self.start_cali_wave(wave)
+                return
+        logger.debug("Calibration Finished")
+        self.is_running = False
+        if self.cali_pairs:
+            finished = events.CalibrationMeasurementFinished
+        else:
+            finished = events.CalibrationSimpleMeasurementFinished
+        await self.bus.handle(finished(calibration_id=self.calibration_id))
+
+    def skip_failed_rounds(
+        self, wave: list[list[str]], missing: list[str]
+    ) -> list[list[str]]:
+        """The rounds of the wave whose devices all acked their setup."""
+        started = []
+        for devices in wave:
+            if not set(missing).isdisjoint(devices):
+                logger.error(f"Calibration round {devices} failed, skip it")
+                for device in devices:
+                    self.cali_active.pop(self.devices.intern(device), None)
+            else:
+                started.append(devices)
+        return started
 
     async def start_calibration(self):
         logger.info(f"Cali Round: {self.cali_rounds}")
@@ -458,20 +831,19 @@ class SITGateway:
             self.cali_setup["initiator_device"] = cali_devices[0]
             self.cali_setup["responder_device"] = [cali_devices[1]]
 
-            self.cali_setup["device_type"] = "initiator"
-            await self.ble_send_json(
+            await self.ble_fan_out(
                 "6ba1de6b-3ab6-4d77-9ea1-cb6422720004",
-                self.cali_setup,
-                self.cali_setup["initiator_device"],
+                {
+                    cali_devices[0]: {
+                        **self.cali_setup,
+                        "device_type": "initiator",
+                    },
+                    cali_devices[1]: {
+                        **self.cali_setup,
+                        "device_type": "responder",
+                    },
+                },
             )
-
-            self.cali_setup["device_type"] = "responder"
-            await self.ble_send_json(
-                "6ba1de6b-3ab6-4d77-9ea1-cb6422720004",
-                self.cali_setup,
-                self.cali_setup["responder_device"][0],
-            )
-            await asyncio.sleep(3)
             self.cali_finished_list.append(cali_devices)
             await self.start_measurement(
                 self.cali_setup["initiator_device"],
@@ -490,12 +862,45 @@ class SITGateway:
     async def ble_send_json(self, uuid, command, device_name):
         try:
             device = self.get_device(device_name)
-            json_msg = json.dumps(command).encode("utf-8")
-            await device.write_command(uuid, json_msg)
+            await device.write_message(uuid, command)
             logger.debug(f"JSON Command Sent: {device_name}")
         except BleakError as e:
             logger.error(f"Can't write JSON Command: {e}")
 
+    async def ble_fan_out(
+        self,
+        uuid: str,
+        messages: dict[str, dict],
+        ack_uuid: str | None = None,
+        timeout: float = 2.0,
+        retries: int = 2,
+    ) -> list[str]:
+        """Write a JSON message to every device at once and await the acks.
+
+        ``messages`` maps the device name to its message. Returns the
+        devices that didn't acknowledge their message.
+        """
+
+        async def send(device_name: str, command: dict) -> bool:
+            device = self.get_device(device_name)
+            if device is None:
+                return False
+            return await device.write_acked(
+                uuid,
+                command,
+                ack_uuid=ack_uuid,
+                timeout=timeout,
+                retries=retries,
+            )
+
+        acks = await asyncio.gather(
+            *(send(name, command) for name, command in messages.items())
+        )
+        missing = [name for name, ack in zip(messages, acks) if not ack]
+        if missing:
+            logger.error(f"No ack for JSON Command from: {missing}")
+        return missing
+
     async def ble_send_int(
         self, uuid: str, intger: int, device_name: str
     ) -> None:
@@ -507,23 +912,42 @@ class SITGateway:
         except BleakError as e:
             logger.error(f"Can't write Int Command: {e}")
 
+    def set_command_encoding(
+        self,
+        device_id: str,
+        encoding: str,
+        write_without_response: bool = False,
+    ) -> None:
+        if encoding not in command_codec.ENCODINGS:
+            raise ValueError(f"Unknown command encoding: {encoding}")
+        self.command_encodings[device_id] = (encoding, write_without_response)
+        device = self.get_device(device_id)
+        if device is not None:
+            device.command_encoding = encoding
+            device.write_without_response = write_without_response
+
     # Utils Gateway Functions
     async def set_measurement_type(self, measurement_type: str) -> None:
         self.measurement_type = measurement_type
 
-    def get_device_index(self, device_name: str) -> int | None:
-        index = 0
-        for device in self.ble_list:
-            if device_name in device.get_device_name():
-                return index
-            index += 1
-        return None
-
     def get_device(self, device_name: str) -> Ble | None:
-        for device in self.ble_list:
-            if device_name in device.get_device_name():
-                return device
-        return None
+        return self.devices.get(device_name)
+
+    def get_measurements(
+        self, initiator: str, responder: str
+    ) -> MeasurementRing:
+        return self.link_measurements(
+            self.devices.intern(initiator), self.devices.intern(responder)
+        )
+
+    def link_measurements(
+        self, initiator_link: int, responder_link: int
+    ) -> MeasurementRing:
+        ring = self.measurements.get((initiator_link, responder_link))
+        if ring is None:
+            ring = MeasurementRing(self.measurement_capacity)
+            self.measurements[(initiator_link, responder_link)] = ring
+        return ring
 
     def get_responder(self, responder_index: int) -> str:
         # modolu 100 because the id
@@ -0,0 +1,87 @@
+# Standard Library
+import asyncio
+
+from typing import Awaitable, Callable
+
+
+class MeasurementBatcher:
+    """Coalesces measurement records per link into columnar batch frames.
+
+    Records sharing the frame type and header are collected until
+    ``max_records`` are reached or the oldest record waited ``max_delay``
+    seconds, then one frame with a list per record field is sent.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = False,
+        max_records: int = 50,
+        max_delay: float = 0.02,
+    ) -> None:
+        self.enabled = enabled
+        self.max_records = max_records
+        self.max_delay = max_delay
+        self._batches: dict[tuple, dict] = {}
+        self._timers: dict[tuple, asyncio.TimerHandle] = {}
+        self._tasks: set[asyncio.Task] = set()
+
+    def configure(
+        self, enabled: bool, max_records: int, max_delay: float
+    ) -> None:
+        self.enabled = enabled
+        self.max_records = max_records
+        self.max_delay = max_delay
+
+    async def add(
+        self,
+        frame_type: str,
+        header: dict,
+        record: dict,
+        send: Callable[..., Awaitable],
+        trace: tuple | None = None,
+        key: tuple | None = None,
+    ) -> None:
+        """Add a record, ``key`` identifies the link, default the header."""
+        if key is None:
+            key = (frame_type, *header.values())
+        batch = self._batches.get(key)
+        if batch is None:
+            batch = {
+                "type": frame_type,
+                "header": header,
+                "columns": {name: [] for name in record},
+                "count": 0,
+                "send": send,
+                # the oldest record decides the latency of the batch
+                "trace": trace,
+            }
+            self._batches[key] = batch
+            self._timers[key] = asyncio.get_running_loop().call_later(
+                self.max_delay, self._flush_later, key
+            )
+        columns = batch["columns"]
+        for name, value in record.items():
+            columns[name].append(value)
+        batch["count"] += 1
+        if batch["count"] >= self.max_records:
+            await self.flush(key)
+
+    async def flush(self, key: tuple) -> None:
+        batch = self._batches.pop(key, None)
+        timer = self._timers.pop(key, None)
+        if timer is not None:
+            timer.cancel()
+        if batch is None:
+            return
+        await batch["send"](
+            batch["type"], batch["header"], batch["columns"], batch["trace"]
+        )
+
+    async def flush_all(self) -> None:
+        for key in list(self._batches):
+            await self.flush(key)
+
+    def _flush_later(self, key: tuple) -> None:
+        task = asyncio.create_task(self.flush(key))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
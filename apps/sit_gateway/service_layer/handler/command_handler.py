@@ -1,20 +1,29 @@
 # pylint: disable=unused-argument
 # Standard Library
-import asyncio
+import dataclasses
 import json
 import logging
 import logging.config
+import time
 
 # Library
 from apps.sit_gateway import gateway
 from apps.sit_gateway.domain import commands
-from apps.sit_gateway.entrypoint import websocket
+from apps.sit_gateway.domain.calibration import calibration_params
+from apps.sit_gateway.domain.ranging import DWT_TIME_UNIT
+from apps.sit_gateway.entrypoint import websocket, wire
+from apps.sit_gateway.service_layer import uow
+from apps.sit_gateway.service_layer.batching import MeasurementBatcher
+from apps.sit_gateway.service_layer.summary import MeasurementSummarizer
 
 
 LOG_CONFIG_PATH = "settings/logging.conf"
 logging.config.fileConfig(LOG_CONFIG_PATH)
 logger = logging.getLogger("command_handler")
 
+# Antenna delay of the firmware, in device time units
+DEFAULT_ANT_DLY = 16385
+
 
 # Send a register msg to webserver for connection when connection is acepted
 async def register_ws_client(
@@ -25,9 +34,16 @@ async def register_ws_client(
         "type": "RegisterWsClient",
         "data": {
             "client_id": command.client_id,
+            "encodings": list(wire.ENCODINGS),
         },
     }
-    await ws.send(json.dumps(message))
+    await ws.send_direct(json.dumps(message))
+
+
+async def set_uplink_encoding(
+    command: commands.SetUplinkEncoding, ws: websocket.Websocket
+):
+    ws.set_encoding(command.encoding)
 
 
 async def ping_ws_connection(
@@ -42,21 +58,152 @@ async def ping_ws_connection(
     await ws.send(json.dumps(message))
 
 
+async def get_latency_summary(
+    command: commands.GetLatencySummary, ws: websocket.Websocket
+):
+    message = {
+        "type": "LatencySummary",
+        "data": ws.latency.summary(),
+    }
+    await ws.send(json.dumps(message))
+
+
+async def configure_uplink_batching(
+    command: commands.ConfigureUplinkBatching, batcher: MeasurementBatcher
+):
+    if not command.enabled:
+        await batcher.flush_all()
+    batcher.configure(
+        enabled=command.enabled,
+        max_records=command.max_records,
+        max_delay=command.max_delay_ms / 1000,
+    )
+
+
+async def configure_uplink_summary(
+    command: commands.ConfigureUplinkSummary,
+    summarizer: MeasurementSummarizer,
+):
+    if not command.enabled:
+        await summarizer.flush_all()
+    summarizer.configure(
+        enabled=command.enabled,
+        interval=command.interval_ms / 1000,
+        raw=command.raw,
+        quantiles=tuple(command.quantiles or summarizer.quantiles),
+    )
+
+
+async def configure_measurement_filter(
+    command: commands.ConfigureMeasurementFilter, gateway: gateway.SITGateway
+):
+    gateway.filter.configure(
+        enabled=command.enabled,
+        window=command.window,
+        threshold=command.threshold,
+        process_noise=command.process_noise,
+        measurement_noise=command.measurement_noise,
+    )
+
+
+async def configure_positioning(
+    command: commands.ConfigurePositioning, gateway: gateway.SITGateway
+):
+    try:
+        gateway.positions.configure(
+            enabled=command.enabled,
+            anchors=command.anchors or {},
+            dimensions=command.dimensions,
+            rate=command.rate_hz,
+            max_age=command.max_age_s,
+            forward_distances=command.forward_distances,
+        )
+    except ValueError as e:
+        logger.error(f"Can't configure positioning: {e}")
+
+
+async def configure_exchange_join(
+    command: commands.ConfigureExchangeJoin, gateway: gateway.SITGateway
+):
+    gateway.joiner.configure(
+        enabled=command.enabled,
+        window=command.window_ms / 1000,
+        max_pending=command.max_pending,
+    )
+
+
+async def configure_ranging(
+    command: commands.ConfigureRanging, gateway: gateway.SITGateway
+):
+    antenna_delays = {
+        gateway.devices.intern(device_id): delay
+        for device_id, delay in (command.antenna_delays or {}).items()
+    }
+    gateway.ranging.configure(
+        enabled=command.enabled,
+        time_unit=command.time_unit or DWT_TIME_UNIT,
+        drift_smoothing=command.drift_smoothing,
+        antenna_delays=antenna_delays,
+    )
+
+
 async def connect_ble_device(
     command: commands.ConnectBleDevice, gateway: gateway.SITGateway
 ):
     await gateway.start_ble_gateway(command.device_id)
 
 
+async def connect_ble_devices(
+    command: commands.ConnectBleDevices, gateway: gateway.SITGateway
+):
+    await gateway.start_ble_gateways(command.device_ids, command.concurrency)
+
+
+async def set_ble_command_encoding(
+    command: commands.SetBleCommandEncoding, gateway: gateway.SITGateway
+):
+    gateway.set_command_encoding(
+        command.device_id, command.encoding, command.write_without_response
+    )
+
+
 async def disconnect_ble_device(
     command: commands.DisconnectBleDevice, gateway: gateway.SITGateway
 ):
     await gateway.stop_ble_gateway(command.device_id)
 
 
+async def calibrated_delays(
+    devices: list[str], gateway: gateway.SITGateway, uow: uow.UnitOfWork
+) -> dict[str, dict]:
+    """Solved antenna delays of the devices, unless a device moved since."""
+    delays = {}
+    async with uow:
+        for device_id in devices:
+            stored = uow.calibrations.antenna_delays(device_id)
+            if stored is None:
+                continue
+            device = gateway.get_device(device_id)
+            address = device.get_device_address() if device else ""
+            if address and stored["address"] != address:
+                logger.info(f"{device_id} moved, its delays aren't used")
+                continue
+            delays[device_id] = {
+                "rx_ant_dly": stored["rx_ant_dly"],
+                "tx_ant_dly": stored["tx_ant_dly"],
+            }
+    return delays
+
+
 async def start_measurement(
-    command: commands.StartDistanceMeasurement, gateway: gateway.SITGateway
+    command: commands.StartDistanceMeasurement,
+    gateway: gateway.SITGateway,
+    uow: uow.UnitOfWork,
 ):
+    devices = [command.initiator, *command.responder]
+    delays = {}
+    if command.rx_ant_dly is None or command.tx_ant_dly is None:
+        delays = await calibrated_delays(devices, gateway, uow)
     setup = {
         "type": "setup_msg",
         "device_type": "",
@@ -67,19 +214,25 @@ async def start_measurement(
         "min_measurement": 0,
         "max_measurement": 0,
         "measurement_type": command.measurement_type,
-        "rx_ant_dly": command.rx_ant_dly,
-        "tx_ant_dly": command.tx_ant_dly,
     }
-    setup["device_type"] = "initiator"
-    await gateway.ble_send_json(
-        "6ba1de6b-3ab6-4d77-9ea1-cb6422720004", setup, command.initiator
+    messages = {
+        responder: {**setup, "device_type": "responder"}
+        for responder in command.responder
+    }
+    messages[command.initiator] = {**setup, "device_type": "initiator"}
+    for device_id, message in messages.items():
+        calibrated = delays.get(device_id, {})
+        for name in ("rx_ant_dly", "tx_ant_dly"):
+            value = getattr(command, name)
+            if value is None:
+                value = calibrated.get(name, DEFAULT_ANT_DLY)
+            message[name] = value
+    missing = await gateway.ble_fan_out(
+        "6ba1de6b-3ab6-4d77-9ea1-cb6422720004", messages
     )
-    setup["device_type"] = "responder"
-    for responder in command.responder:
-        await gateway.ble_send_json(
-            "6ba1de6b-3ab6-4d77-9ea1-cb6422720004", setup, responder
-        )
-    await asyncio.sleep(3)
+    if missing:
+        logger.error("Measurement not started, not every device is set up")
+        return
     await gateway.set_measurement_type(command.measurement_type)
     await gateway.start_measurement(
         initiator_device=command.initiator,
@@ -88,26 +241,90 @@ async def start_measurement(
 
 
 async def stop_measurement(
-    command: commands.StopDistanceMeasurement, gateway: gateway.SITGateway
+    command: commands.StopDistanceMeasurement,
+    gateway: gateway.SITGateway,
+    summarizer: MeasurementSummarizer,
 ):
     try:
         await gateway.stop_measurement()
     except Exception as e:  # pylint: disable=broad-exception-caught
         logger.error(f"Exception: {e}")
+    await summarizer.flush_all()
+
+
+async def start_session(uow: uow.UnitOfWork, session_id: str, command):
+    async with uow:
+        uow.sessions.start(
+            session_id, type(command).__name__, dataclasses.asdict(command)
+        )
+        await uow.commit()
 
 
 async def start_test_measurement(
-    command: commands.StartTestMeasurement, gateway: gateway.SITGateway
+    command: commands.StartTestMeasurement,
+    gateway: gateway.SITGateway,
+    uow: uow.UnitOfWork,
 ):
-    await gateway.setup_test(command)
+    await start_session(uow, f"test:{command.test_id}", command)
+    delays = await calibrated_delays(
+        [command.initiator, *command.responder], gateway, uow
+    )
+    await gateway.setup_test(command, antenna_delays=delays)
+
+
+async def cached_calibration_rounds(
+    command: (
+        commands.StartCalibrationMeasurement
+        | commands.StartSimpleCalibrationMeasurement
+        | commands.StartDebugCalibration
+    ),
+    gateway: gateway.SITGateway,
+    uow: uow.UnitOfWork,
+) -> set[tuple[str, ...]]:
+    """Remember the devices, return the finished rounds to reuse.
+
+    A round is reused if it finished with the same parameters within
+    ``max_age_s`` and none of its devices is new or moved to another
+    address since.
+    """
+    params = calibration_params(command)
+    since = time.time() - command.max_age_s if command.max_age_s else 0.0
+    unchanged = set()
+    async with uow:
+        known = uow.calibrations.devices(params)
+        rounds = uow.calibrations.finished_rounds(params, since)
+        for device_id in command.devices:
+            device = gateway.get_device(device_id)
+            address = device.get_device_address() if device else ""
+            stored = known.get(device_id)
+            if stored is not None:
+                if address and stored["address"] != address:
+                    logger.info(f"{device_id} changed, recalibrate it")
+                else:
+                    unchanged.add(device_id)
+                    address = address or stored["address"]
+            uow.calibrations.set_device(
+                params,
+                device_id,
+                address,
+                command.rx_ant_dly,
+                command.tx_ant_dly,
+            )
+        await uow.commit()
+    if not command.incremental:
+        return set()
+    return {devices for devices in rounds if unchanged.issuperset(devices)}
 
 
 async def start_calibration(
     command: commands.StartCalibrationMeasurement,
     gateway: gateway.SITGateway,
+    uow: uow.UnitOfWork,
 ):
+    cached = await cached_calibration_rounds(command, gateway, uow)
+    await start_session(uow, f"calibration:{command.calibration_id}", command)
     await gateway.set_measurement_type(command.measurement_type)
-    await gateway.setup_calibration(command)
+    await gateway.setup_calibration(command, cached)
 
 
 async def start_single_cali_measurement(
@@ -125,16 +342,70 @@ async def start_simple_calibration(
         | commands.StartDebugCalibration
     ),
     gateway: gateway.SITGateway,
+    uow: uow.UnitOfWork,
 ):
     if gateway.is_running is not True:
         logger.debug("Start Simple Calibration")
-        await gateway.setup_simple_calibration(command)
+        cached = await cached_calibration_rounds(command, gateway, uow)
+        await start_session(
+            uow, f"calibration:{command.calibration_id}", command
+        )
+        await gateway.setup_simple_calibration(command, cached)
+
+
+async def resume_session(
+    command: commands.ResumeSession,
+    gateway: gateway.SITGateway,
+    uow: uow.UnitOfWork,
+):
+    """Continue an interrupted session, the devices must be connected."""
+    async with uow:
+        session = uow.sessions.get(command.session_id)
+    if session is None or session["finished"]:
+        logger.error(f"No session to resume: {command.session_id}")
+        return
+    if gateway.is_running is True:
+        logger.error("Can't resume while a measurement is running")
+        return
+    logger.info(f"Resume {session['session_id']}: {session['progress']}")
+    start = getattr(commands, session["command_type"])(**session["command"])
+
+    if isinstance(start, commands.StartTestMeasurement):
+        measurement = session["progress"].get("measurement")
+        delays = await calibrated_delays(
+            [start.initiator, *start.responder], gateway, uow
+        )
+        await gateway.setup_test(
+            start, 0 if measurement is None else measurement + 1, delays
+        )
+        return
+
+    async with uow:
+        finished = uow.calibrations.finished_rounds(
+            calibration_params(start), calibration_id=start.calibration_id
+        )
+    cached = finished | await cached_calibration_rounds(start, gateway, uow)
+    if isinstance(start, commands.StartCalibrationMeasurement):
+        await gateway.set_measurement_type(start.measurement_type)
+        await gateway.setup_calibration(start, cached)
+    else:
+        await gateway.setup_simple_calibration(start, cached)
 
 
 COMMAND_HANDLER = {
     commands.RegisterWsClient: register_ws_client,
     commands.PingWsConnection: ping_ws_connection,
+    commands.SetUplinkEncoding: set_uplink_encoding,
+    commands.ConfigureUplinkBatching: configure_uplink_batching,
+    commands.ConfigureUplinkSummary: configure_uplink_summary,
+    commands.ConfigureRanging: configure_ranging,
+    commands.ConfigurePositioning: configure_positioning,
+    commands.ConfigureExchangeJoin: configure_exchange_join,
+    commands.ConfigureMeasurementFilter: configure_measurement_filter,
+    commands.GetLatencySummary: get_latency_summary,
     commands.ConnectBleDevice: connect_ble_device,
+    commands.ConnectBleDevices: connect_ble_devices,
+    commands.SetBleCommandEncoding: set_ble_command_encoding,
     commands.DisconnectBleDevice: disconnect_ble_device,
     commands.StartDistanceMeasurement: start_measurement,
     commands.StopDistanceMeasurement: stop_measurement,
@@ -143,4 +414,5 @@ COMMAND_HANDLER = {
     commands.StartSingleCalibrationMeasurement: start_single_cali_measurement,
     commands.StartSimpleCalibrationMeasurement: start_simple_calibration,
     commands.StartDebugCalibration: start_simple_calibration,
+    commands.ResumeSession: resume_session,
 }
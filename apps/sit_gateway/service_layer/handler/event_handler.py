@@ -2,12 +2,21 @@
 import json
 import logging
 import logging.config
+import time
 
 from email import message
 
 # Library
-from apps.sit_gateway.domain import events
-from apps.sit_gateway.entrypoint import websocket
+from apps.sit_gateway.domain import commands, events
+from apps.sit_gateway.domain.calibration import (
+    AntennaDelaySolver,
+    calibration_params,
+)
+from apps.sit_gateway.entrypoint import websocket, wire
+from apps.sit_gateway.service_layer import uow
+from apps.sit_gateway.service_layer.batching import MeasurementBatcher
+from apps.sit_gateway.service_layer.summary import MeasurementSummarizer
+from apps.sit_gateway.service_layer.tracing import now
 
 
 LOG_CONFIG_PATH = "settings/logging.conf"
@@ -16,6 +25,9 @@ logging.config.fileConfig(LOG_CONFIG_PATH)
 # create logger
 logger = logging.getLogger("event_handler")
 
+# Measurements of a test between two checkpoints of its session
+TEST_CHECKPOINT_INTERVAL = 100
+
 
 async def register_ble_connection(
     event: events.BleDeviceConnected,
@@ -39,54 +51,186 @@ async def unregister_ble_connection(
     await ws.send(json.dumps(message))
 
 
+def gateway_fields(event) -> dict:
+    """Fields of the measurement event computed on the gateway, if set."""
+    return {
+        name: value
+        for name in events.GATEWAY_FIELDS
+        if (value := getattr(event, name)) is not None
+    }
+
+
 async def send_distance_measurement(
-    event: events.DistanceMeasurement, ws: websocket.Websocket
+    event: events.DistanceMeasurement,
+    ws: websocket.Websocket,
+    batcher: MeasurementBatcher,
+    summarizer: MeasurementSummarizer,
 ):
+    trace = (event.received_at, event.decoded_at, now())
+    header = {
+        "initiator": event.initiator,
+        "responder": event.responder,
+        "measurement_type": event.measurement_type,
+    }
+    record = {
+        "sequence": event.sequence,
+        "measurement": event.measurement,
+        "distance": event.distance,
+        "time_round_1": event.time_round_1,
+        "time_round_2": event.time_round_2,
+        "time_reply_1": event.time_reply_1,
+        "time_reply_2": event.time_reply_2,
+        "nlos_final": event.nlos,
+        "rssi_final": event.rssi,
+        "fpi_final": event.fpi,
+    }
+    extra = gateway_fields(event)
+    record.update(extra)
+    if summarizer.enabled:
+        summary = {
+            "sequence": (event.sequence,),
+            "distance": (event.distance,),
+            "rssi": (event.rssi,),
+            "fpi": (event.fpi,),
+        }
+        for name, value in extra.items():
+            summary[name] = (value,)
+        summarizer.add(
+            "SaveMeasurementSummary",
+            header,
+            summary,
+            ws.send,
+            key=(event.initiator_id, event.responder_id),
+        )
+        if not summarizer.raw:
+            return
+    if batcher.enabled:
+        await batcher.add(
+            "SaveMeasurementBatch",
+            header,
+            record,
+            ws.send_batch,
+            trace,
+            key=(
+                "SaveMeasurementBatch",
+                event.initiator_id,
+                event.responder_id,
+                *extra,
+            ),
+        )
+        return
+    if ws.encoding == wire.BINARY:
+        columns = {name: [value] for name, value in record.items()}
+        await ws.send_batch("SaveMeasurementBatch", header, columns, trace)
+        return
     message = {
         "type": "SaveMesurement",
-        "data": {
-            "initiator": event.initiator,
-            "responder": event.responder,
-            "measurement_type": event.measurement_type,
-            "sequence": event.sequence,
-            "measurement": event.measurement,
-            "distance": event.distance,
-            "time_round_1": event.time_round_1,
-            "time_round_2": event.time_round_2,
-            "time_reply_1": event.time_reply_1,
-            "time_reply_2": event.time_reply_2,
-            "nlos_final": event.nlos,
-            "rssi_final": event.rssi,
-            "fpi_final": event.fpi,
-        },
+        "data": {**header, **record},
     }
     logger.debug(f"Sending distance measurement: {message}")
-    await ws.send(json.dumps(message))
+    data_msg = json.dumps(message)
+    await ws.send(data_msg, (*trace, now()))
+
+
+async def send_distance_measurement_batch(
+    event: events.DistanceMeasurementBatch,
+    ws: websocket.Websocket,
+    summarizer: MeasurementSummarizer,
+):
+    trace = (event.received_at, event.decoded_at, now())
+    records = event.records.to_dict()
+    header = {
+        "initiator": event.initiator,
+        "responder": event.responder,
+        "measurement_type": event.measurement_type,
+    }
+    extra = gateway_fields(event)
+    if summarizer.enabled:
+        summary = {
+            "sequence": records["sequence"],
+            "distance": records["distance"],
+            "rssi": records["rssi"],
+            "fpi": records["fpi"],
+            **extra,
+        }
+        summarizer.add(
+            "SaveMeasurementSummary",
+            header,
+            summary,
+            ws.send,
+            key=(event.initiator_id, event.responder_id),
+        )
+        if not summarizer.raw:
+            return
+    columns = {
+        "sequence": records["sequence"],
+        "measurement": records["measurement"],
+        "distance": records["distance"],
+        "time_round_1": records["time_round_1"],
+        "time_round_2": records["time_round_2"],
+        "time_reply_1": records["time_reply_1"],
+        "time_reply_2": records["time_reply_2"],
+        "nlos_final": records["nlos"],
+        "rssi_final": records["rssi"],
+        "fpi_final": records["fpi"],
+    }
+    columns.update(extra)
+    logger.debug(f"Sending {len(event.records)} distance measurements")
+    await ws.send_batch("SaveMeasurementBatch", header, columns, trace)
 
 
 async def send_test_measurement(
-    event: events.TestMeasurement, ws: websocket.Websocket
+    event: events.TestMeasurement,
+    ws: websocket.Websocket,
+    batcher: MeasurementBatcher,
 ):
+    trace = (event.received_at, event.decoded_at, now())
+    header = {
+        "test_id": event.test_id,
+        "initiator": event.initiator,
+        "responder": event.responder,
+        "measurement_type": event.measurement_type,
+    }
+    record = {
+        "sequence": event.sequence,
+        "measurement": event.measurement,
+        "distance": event.distance,
+        "time_round_1": event.time_round_1,
+        "time_round_2": event.time_round_2,
+        "time_reply_1": event.time_reply_1,
+        "time_reply_2": event.time_reply_2,
+        "nlos_final": event.nlos,
+        "rssi_final": event.rssi,
+        "fpi_final": event.fpi,
+    }
+    extra = gateway_fields(event)
+    record.update(extra)
+    if batcher.enabled:
+        await batcher.add(
+            "SaveTestMeasurementBatch",
+            header,
+            record,
+            ws.send_batch,
+            trace,
+            key=(
+                "SaveTestMeasurementBatch",
+                event.test_id,
+                event.initiator_id,
+                event.responder_id,
+                *extra,
+            ),
+        )
+        return
+    if ws.encoding == wire.BINARY:
+        columns = {name: [value] for name, value in record.items()}
+        await ws.send_batch("SaveTestMeasurementBatch", header, columns, trace)
+        return
     message = {
         "type": "SaveTestMeasurement",
-        "data": {
-            "test_id": event.test_id,
-            "initiator": event.initiator,
-            "responder": event.responder,
-            "measurement_type": event.measurement_type,
-            "sequence": event.sequence,
-            "measurement": event.measurement,
-            "distance": event.distance,
-            "time_round_1": event.time_round_1,
-            "time_round_2": event.time_round_2,
-            "time_reply_1": event.time_reply_1,
-            "time_reply_2": event.time_reply_2,
-            "nlos_final": event.nlos,
-            "rssi_final": event.rssi,
-            "fpi_final": event.fpi,
-        },
+        "data": {**header, **record},
     }
-    await ws.send(json.dumps(message))
+    data_msg = json.dumps(message)
+    await ws.send(data_msg, (*trace, now()))
 
 
 async def send_calibration_measurement(
@@ -149,8 +293,12 @@ async def send_simple_calibration_measurement(
 
 
 async def send_test_finished(
-    event: events.TestMeasurementFinished, ws: websocket.Websocket
+    event: events.TestMeasurementFinished,
+    ws: websocket.Websocket,
+    batcher: MeasurementBatcher,
 ):
+    # The backend expects all measurements before the test is finished
+    await batcher.flush_all()
     message = {
         "type": "TestFinished",
         "data": {
@@ -160,11 +308,119 @@ async def send_test_finished(
     await ws.send(json.dumps(message))
 
 
+async def save_calibration_round(
+    event: events.CalibrationRoundFinished, uow: uow.UnitOfWork
+):
+    async with uow:
+        uow.calibrations.add_round(
+            event.params,
+            event.devices,
+            event.calibration_id,
+            event.measurements,
+            event.mean_distance,
+        )
+        uow.sessions.checkpoint(
+            f"calibration:{event.calibration_id}",
+            {"last_round": event.devices},
+        )
+        await uow.commit()
+
+
+async def checkpoint_test(event: events.TestMeasurement, uow: uow.UnitOfWork):
+    if (event.measurement + 1) % TEST_CHECKPOINT_INTERVAL:
+        return
+    async with uow:
+        uow.sessions.checkpoint(
+            f"test:{event.test_id}", {"measurement": event.measurement}
+        )
+        await uow.commit()
+
+
+async def solve_antenna_delays(
+    event: events.CalibrationMeasurementFinished,
+    ws: websocket.Websocket,
+    uow: uow.UnitOfWork,
+):
+    """Fit the antenna delays over the pair rounds, send them at once.
+
+    Needs the true distances of the calibration command, the delays are
+    added to the ones the devices were set up with.
+    """
+    async with uow:
+        session = uow.sessions.get(f"calibration:{event.calibration_id}")
+        if session is None:
+            return
+        setup = getattr(commands, session["command_type"])(
+            **session["command"]
+        )
+        if not isinstance(setup, commands.StartCalibrationMeasurement):
+            return
+        if not (setup.reference_distance or setup.distances):
+            return
+        params = calibration_params(setup)
+        since = time.time() - setup.max_age_s if setup.max_age_s else 0.0
+        solver = AntennaDelaySolver(setup.reference_distance, setup.distances)
+        devices = set(setup.devices)
+        # cached rounds of an incremental calibration are part of the fit
+        for (
+            round_devices,
+            count,
+            mean_distance,
+        ) in uow.calibrations.round_results(params, since):
+            # Only the two device rounds range one pair of devices
+            if (
+                len(round_devices) == 2
+                and mean_distance is not None
+                and devices.issuperset(round_devices)
+            ):
+                solver.add(
+                    round_devices[0], round_devices[1], mean_distance, count
+                )
+        result = solver.solve()
+        if result is None:
+            logger.error(
+                f"Calibration {event.calibration_id}: "
+                "the pairs don't determine the antenna delays"
+            )
+            return
+        for device_id, delays in result["devices"].items():
+            delays["rx_ant_dly"] += setup.rx_ant_dly
+            delays["tx_ant_dly"] += setup.tx_ant_dly
+            uow.calibrations.set_antenna_delays(
+                params, device_id, delays["rx_ant_dly"], delays["tx_ant_dly"]
+            )
+        await uow.commit()
+    message = {
+        "type": "SaveAntennaDelayCalibration",
+        "data": {"calibration_id": event.calibration_id, **result},
+    }
+    await ws.send(json.dumps(message))
+
+
+async def finish_session(
+    event: (
+        events.CalibrationMeasurementFinished
+        | events.CalibrationSimpleMeasurementFinished
+        | events.TestMeasurementFinished
+    ),
+    uow: uow.UnitOfWork,
+):
+    if isinstance(event, events.TestMeasurementFinished):
+        session_id = f"test:{event.test_id}"
+    else:
+        session_id = f"calibration:{event.calibration_id}"
+    async with uow:
+        uow.sessions.finish(session_id)
+        await uow.commit()
+
+
 async def redirect_event(
     event: (
         events.BleDeviceConnectFailed
         | events.BleDeviceConnectError
+        | events.CalibrationPlanned
         | events.CalibrationMeasurementFinished
+        | events.PositionMeasurement
     ),
     ws: websocket.Websocket,
 ):
@@ -178,10 +434,21 @@ EVENT_HANDLER = {
     events.BleDeviceConnectFailed: [redirect_event],
     events.BleDeviceDisconnected: [unregister_ble_connection],
     events.DistanceMeasurement: [send_distance_measurement],
+    events.DistanceMeasurementBatch: [send_distance_measurement_batch],
+    events.PositionMeasurement: [redirect_event],
     events.CalibrationMeasurement: [send_calibration_measurement],
-    events.CalibrationMeasurementFinished: [redirect_event],
-    events.TestMeasurement: [send_test_measurement],
+    events.CalibrationPlanned: [redirect_event],
+    events.CalibrationRoundFinished: [save_calibration_round],
+    events.CalibrationMeasurementFinished: [
+        solve_antenna_delays,
+        redirect_event,
+        finish_session,
+    ],
+    events.TestMeasurement: [send_test_measurement, checkpoint_test],
     events.SimpleCalibrationMeasurement: [send_simple_calibration_measurement],
-    events.CalibrationSimpleMeasurementFinished: [redirect_event],
-    events.TestMeasurementFinished: [send_test_finished],
+    events.CalibrationSimpleMeasurementFinished: [
+        redirect_event,
+        finish_session,
+    ],
+    events.TestMeasurementFinished: [send_test_finished, finish_session],
 }
@@ -1,7 +1,11 @@
+# Standard Library
+import asyncio
 import logging
 import logging.config
-from apps.sit_gateway.domain import commands, events
 
+# Library
+from apps.sit_gateway.domain import commands, events
+from apps.sit_gateway.service_layer.metrics import Metrics
 
 
 LOG_CONFIG_PATH = "settings/logging.conf"
@@ -12,32 +16,119 @@ logger = logging.getLogger("messagebus")
 
 
 class MessageBus:
-    def __init__(self, uow, event_handlers, command_handlers):
+    """Dispatches events and commands to their injected handlers.
+
+    ``handle`` is reentrant, it keeps no state between calls. Messages
+    passed to ``submit`` are handled by a bounded pool of worker tasks, so
+    the caller does not wait for long running commands.
+    """
+
+    def __init__(
+        self,
+        uow,
+        event_handlers,
+        command_handlers,
+        concurrent_events: bool = False,
+        workers: int = 1,
+        backlog: int = 1024,
+        metrics: Metrics | None = None,
+    ):
         self.uow = uow
         self.event_handlers = event_handlers
         self.command_handlers = command_handlers
-        self.queue = []
+        self.concurrent_events = concurrent_events
+        self.workers = workers
+        self.backlog = backlog
+        self.metrics = metrics
+
+        # message type -> (is an event, handlers), resolved once
+        self._dispatch: dict[type, tuple] = {}
+        for event_type, handlers in event_handlers.items():
+            self._dispatch[event_type] = (True, tuple(handlers))
+        for command_type, handler in command_handlers.items():
+            self._dispatch[command_type] = (False, handler)
+
+        self._pending: asyncio.Queue | None = None
+        self._worker_tasks: set[asyncio.Task] = set()
 
     async def handle(self, message):
-        self.queue = [message]
-        while self.queue:
-            message = self.queue.pop(0)
-            if isinstance(message, events.Event):
-                await self.handle_event(message)
-            elif isinstance(message, commands.Command):
-                logger.debug(message)
-                await self.handle_command(message)
+        dispatch = self._dispatch.get(type(message))
+        if dispatch is None:
+            dispatch = self._resolve(message)
+        is_event, handlers = dispatch
+        if self.metrics is not None:
+            await self._handle_measured(message, is_event, handlers)
+        elif not is_event:
+            await self._run_command(message, handlers)
+        elif self.concurrent_events and len(handlers) > 1:
+            await asyncio.gather(*(handler(message) for handler in handlers))
+        else:
+            # the common case, without another coroutine per message
+            for handler in handlers:
+                await handler(message)
+
+    async def _handle_measured(self, message, is_event: bool, handlers):
+        self.metrics.count_message(type(message).__name__)
+        self.metrics.enter()
+        try:
+            if is_event:
+                await self._run_event(message, handlers)
             else:
-                raise Exception(f"{message} was not an Event or Command") #pylint: disable=broad-exception-raised
+                await self._run_command(message, handlers)
+        finally:
+            self.metrics.leave()
 
     async def handle_event(self, event):
-        handlers = self.event_handlers[type(event)]
+        await self._run_event(event, self.event_handlers[type(event)])
+
+    async def handle_command(self, command):
+        await self._run_command(command, self.command_handlers[type(command)])
+
+    @property
+    def backlog_depth(self) -> int:
+        return self._pending.qsize() if self._pending is not None else 0
+
+    async def submit(self, message):
+        """Queue the message for the worker pool, waits if it is full."""
+        if self._pending is None:
+            self._pending = asyncio.Queue(maxsize=self.backlog)
+            for number in range(self.workers):
+                task = asyncio.create_task(
+                    self._worker(), name=f"Messagebus Worker {number}"
+                )
+                self._worker_tasks.add(task)
+                task.add_done_callback(self._worker_tasks.discard)
+        await self._pending.put(message)
+
+    async def _worker(self):
+        while True:
+            message = await self._pending.get()
+            try:
+                await self.handle(message)
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                logger.error(f"Handling {message} failed: {e}")
+            finally:
+                self._pending.task_done()
+
+    async def _run_event(self, event, handlers):
+        if self.concurrent_events and len(handlers) > 1:
+            await asyncio.gather(*(handler(event) for handler in handlers))
+            return
         for handler in handlers:
             await handler(event)
-            # self.queue.extend(self.uow.collect_new_events())
 
-    async def handle_command(self, command):
-        handler = self.command_handlers[type(command)]
-        # for handler in handlers:
+    async def _run_command(self, command, handler):
+        logger.debug(command)
         await handler(command)
-        # self.queue.extend(self.uow.collect_new_events())
+
+    def _resolve(self, message) -> tuple:
+        if isinstance(message, events.Event):
+            dispatch = (True, ())
+        elif isinstance(message, commands.Command):
+            raise KeyError(f"No handler for {type(message).__name__}")
+        else:
+            raise Exception(  # pylint: disable=broad-exception-raised
+                f"{message} was not an Event or Command"
+            )
+        self._dispatch[type(message)] = dispatch
+        return dispatch
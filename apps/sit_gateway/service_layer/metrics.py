@@ -0,0 +1,155 @@
+# Standard Library
+import math
+
+from bisect import bisect_left
+from typing import Callable, NamedTuple
+
+
+# Upper bounds in seconds of the latency histogram buckets
+BUCKETS = (
+    0.0001,
+    0.00025,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    math.inf,
+)
+
+
+class Histogram:
+    def __init__(self, buckets: tuple[float, ...] = BUCKETS) -> None:
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Gauge(NamedTuple):
+    help_text: str
+    kind: str
+    read: Callable[[], float]
+
+
+class Metrics:
+    """Message bus counters, handler latencies and gauges.
+
+    Rendered in the Prometheus text exposition format.
+    """
+
+    def __init__(self) -> None:
+        self.messages: dict[str, int] = {}
+        self.handler_latency: dict[str, Histogram] = {}
+        self.handler_errors: dict[str, int] = {}
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._gauges: dict[str, Gauge] = {}
+
+    def count_message(self, message_type: str) -> None:
+        self.messages[message_type] = self.messages.get(message_type, 0) + 1
+
+    def enter(self) -> None:
+        self.in_flight += 1
+        if self.in_flight > self.max_in_flight:
+            self.max_in_flight = self.in_flight
+
+    def leave(self) -> None:
+        self.in_flight -= 1
+
+    def observe_handler(
+        self, handler: str, seconds: float, failed: bool = False
+    ) -> None:
+        histogram = self.handler_latency.get(handler)
+        if histogram is None:
+            histogram = self.handler_latency[handler] = Histogram()
+        histogram.observe(seconds)
+        if failed:
+            self.handler_errors[handler] = (
+                self.handler_errors.get(handler, 0) + 1
+            )
+
+    def register_gauge(
+        self,
+        name: str,
+        help_text: str,
+        read: Callable[[], float],
+        kind: str = "gauge",
+    ) -> None:
+        """Export a value read on every scrape, e.g. a queue depth."""
+        self._gauges[name] = Gauge(help_text, kind, read)
+
+    def render(self) -> str:
+        lines = [
+            "# HELP sit_messages_total Messages handled by the message bus.",
+            "# TYPE sit_messages_total counter",
+        ]
+        for message_type, count in sorted(self.messages.items()):
+            lines.append(
+                f'sit_messages_total{{type="{message_type}"}} {count}'
+            )
+
+        lines += [
+            "# HELP sit_handler_errors_total Handler calls that raised.",
+            "# TYPE sit_handler_errors_total counter",
+        ]
+        for handler, count in sorted(self.handler_errors.items()):
+            lines.append(
+                f'sit_handler_errors_total{{handler="{handler}"}} {count}'
+            )
+
+        lines += [
+            "# HELP sit_handler_duration_seconds Latency of the handlers.",
+            "# TYPE sit_handler_duration_seconds histogram",
+        ]
+        for handler, histogram in sorted(self.handler_latency.items()):
+            cumulative = 0
+            for bound, count in zip(histogram.buckets, histogram.counts):
+                cumulative += count
+                le = "+Inf" if bound == math.inf else repr(bound)
+                lines.append(
+                    "sit_handler_duration_seconds_bucket"
+                    f'{{handler="{handler}",le="{le}"}} {cumulative}'
+                )
+            lines.append(
+                f'sit_handler_duration_seconds_sum{{handler="{handler}"}} '
+                f"{histogram.sum}"
+            )
+            lines.append(
+                f'sit_handler_duration_seconds_count{{handler="{handler}"}} '
+                f"{histogram.count}"
+            )
+
+        gauges = {
+            "sit_messages_in_flight": Gauge(
+                "Messages currently handled by the bus.",
+                "gauge",
+                lambda: self.in_flight,
+            ),
+            "sit_messages_in_flight_max": Gauge(
+                "Highest number of messages handled at once.",
+                "gauge",
+                lambda: self.max_in_flight,
+            ),
+            **self._gauges,
+        }
+        for name, gauge in gauges.items():
+            lines += [
+                f"# HELP {name} {gauge.help_text}",
+                f"# TYPE {name} {gauge.kind}",
+                f"{name} {gauge.read()}",
+            ]
+        return "\n".join(lines) + "\n"
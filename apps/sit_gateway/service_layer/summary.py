@@ -0,0 +1,119 @@
+# Standard Library
+import asyncio
+import json
+
+from typing import Awaitable, Callable, Sequence
+
+# Library
+from apps.sit_gateway.domain.stats import RunningStats
+
+
+# Record fields that are summarized, if the records carry them
+SUMMARY_FIELDS = (
+    "distance",
+    "distance_corrected",
+    "distance_filtered",
+    "quality",
+    "rssi",
+    "fpi",
+)
+
+
+class MeasurementSummarizer:
+    """Aggregates the measurement records of every link into summaries.
+
+    The statistics of a link are collected for ``interval`` seconds from
+    its first record on, then one summary frame is sent and they start
+    over. With ``raw`` the records are sent as well.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = False,
+        interval: float = 1.0,
+        raw: bool = False,
+        quantiles: tuple[float, ...] = (0.5, 0.9),
+    ) -> None:
+        self.enabled = enabled
+        self.interval = interval
+        self.raw = raw
+        self.quantiles = quantiles
+        self._links: dict[tuple, dict] = {}
+        self._timers: dict[tuple, asyncio.TimerHandle] = {}
+        self._tasks: set[asyncio.Task] = set()
+
+    def configure(
+        self,
+        enabled: bool,
+        interval: float,
+        raw: bool,
+        quantiles: tuple[float, ...],
+    ) -> None:
+        self.enabled = enabled
+        self.interval = interval
+        self.raw = raw
+        self.quantiles = quantiles
+
+    def add(
+        self,
+        frame_type: str,
+        header: dict,
+        columns: dict[str, Sequence[float]],
+        send: Callable[[str], Awaitable],
+        key: tuple,
+    ) -> None:
+        """Add the columns of one or more records of the link ``key``."""
+        link = self._links.get(key)
+        if link is None:
+            link = {
+                "type": frame_type,
+                "header": header,
+                "send": send,
+                "stats": {},
+                "first_sequence": None,
+                "last_sequence": None,
+            }
+            self._links[key] = link
+            self._timers[key] = asyncio.get_running_loop().call_later(
+                self.interval, self._flush_later, key
+            )
+        sequences = columns.get("sequence")
+        if sequences:
+            if link["first_sequence"] is None:
+                link["first_sequence"] = sequences[0]
+            link["last_sequence"] = sequences[-1]
+        stats = link["stats"]
+        for name in SUMMARY_FIELDS:
+            values = columns.get(name)
+            if values is None:
+                continue
+            field = stats.get(name)
+            if field is None:
+                field = stats[name] = RunningStats(self.quantiles)
+            for value in values:
+                field.add(value)
+
+    async def flush(self, key: tuple) -> None:
+        link = self._links.pop(key, None)
+        timer = self._timers.pop(key, None)
+        if timer is not None:
+            timer.cancel()
+        if link is None:
+            return
+        data = {
+            **link["header"],
+            "first_sequence": link["first_sequence"],
+            "last_sequence": link["last_sequence"],
+        }
+        for name, stats in link["stats"].items():
+            data[name] = stats.to_dict()
+        await link["send"](json.dumps({"type": link["type"], "data": data}))
+
+    async def flush_all(self) -> None:
+        for key in list(self._links):
+            await self.flush(key)
+
+    def _flush_later(self, key: tuple) -> None:
+        task = asyncio.create_task(self.flush(key))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
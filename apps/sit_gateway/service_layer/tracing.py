@@ -0,0 +1,54 @@
+# Standard Library
+import time
+
+from collections import deque
+
+
+STAGES = ("decode", "bus", "serialize", "send", "total")
+
+
+def now() -> float:
+    return time.monotonic()
+
+
+class LatencyTracker:
+    """Rolling per stage latencies from BLE receive to websocket send.
+
+    A trace is the tuple of monotonic timestamps (received, decoded,
+    handled, serialized), the sender adds the time the frame left.
+    """
+
+    def __init__(self, window: int = 2048) -> None:
+        self.window = window
+        self._samples = {stage: deque(maxlen=window) for stage in STAGES}
+
+    def record(self, trace: tuple[float, float, float, float], sent: float):
+        received, decoded, handled, serialized = trace
+        if not received:
+            return
+        samples = self._samples
+        samples["decode"].append(decoded - received)
+        samples["bus"].append(handled - decoded)
+        samples["serialize"].append(serialized - handled)
+        samples["send"].append(sent - serialized)
+        samples["total"].append(sent - received)
+
+    def summary(self) -> dict[str, dict]:
+        summary = {}
+        for stage, samples in self._samples.items():
+            ordered = sorted(samples)
+            if not ordered:
+                summary[stage] = {"count": 0}
+                continue
+            summary[stage] = {
+                "count": len(ordered),
+                "p50_ms": _percentile(ordered, 0.50) * 1000,
+                "p90_ms": _percentile(ordered, 0.90) * 1000,
+                "p99_ms": _percentile(ordered, 0.99) * 1000,
+                "max_ms": ordered[-1] * 1000,
+            }
+        return summary
+
+
+def _percentile(ordered: list[float], quantile: float) -> float:
+    return ordered[min(len(ordered) - 1, int(quantile * len(ordered)))]
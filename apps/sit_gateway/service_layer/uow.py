@@ -3,6 +3,13 @@ from __future__ import annotations
 
 # Standard Library
 import abc
+import sqlite3
+
+# Library
+from apps.sit_gateway.adapter.repository import (
+    CalibrationRepository,
+    SessionRepository,
+)
 
 
 class AbstractUnitOfWork(abc.ABC):
@@ -25,7 +32,18 @@ class AbstractUnitOfWork(abc.ABC):
 
 
 class UnitOfWork(AbstractUnitOfWork):
+    calibrations: CalibrationRepository
+    sessions: SessionRepository
+
+    def __init__(self, path: str = ":memory:") -> None:
+        self.path = path
+        self._connection: sqlite3.Connection | None = None
+
     async def __aenter__(self) -> AbstractUnitOfWork:
+        if self._connection is None:
+            self._connection = sqlite3.connect(self.path)
+            self.calibrations = CalibrationRepository(self._connection)
+            self.sessions = SessionRepository(self._connection)
         return await super().__aenter__()
 
     async def __aexit__(self, *args):
@@ -35,7 +53,8 @@ class UnitOfWork(AbstractUnitOfWork):
         await self._commit()
 
     async def _commit(self):
-        pass
+        self._connection.commit()
 
     async def rollback(self):
-        pass
+        if self._connection is not None:
+            self._connection.rollback()
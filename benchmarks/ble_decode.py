@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+"""Microbenchmark for the BLE notification decoder.
+
+Compares the previous per-packet if/elif decoding of
+``Ble.on_distance_notification`` with the precompiled decoder registry.
+Run from the repository root: ``python -m benchmarks.ble_decode``
+"""
+
+# Standard Library
+import logging
+import struct
+import timeit
+
+# Library
+from apps.sit_gateway.adapter import decoder
+from apps.sit_gateway.domain.data import MsgData, SimpleMsgData
+
+
+logger = logging.getLogger("benchmark")
+logger.setLevel(logging.INFO)
+
+PACKETS = 200_000
+
+
+def legacy_decode(data):
+    dstwr_msg_structure = "15s 15s H I I f f f f f"
+    simple_msg_sturcture = "15s I I f f f f f f f f f f f f f f f I"
+    dstwr_msg_structure_all = "15s 15s H I I f f f f f f f H H"
+    logger.debug(f"MSG Structure: {struct.calcsize(dstwr_msg_structure)}")
+    logger.debug(
+        f"All MSG Structure: {struct.calcsize(dstwr_msg_structure_all)}"
+    )
+    logger.debug(
+        f"Simple MSG Structure: {struct.calcsize(simple_msg_sturcture)}"
+    )
+    logger.debug(f"Data Lenght: {len(data)}")
+    if struct.calcsize(dstwr_msg_structure) == len(data):
+        buf = struct.unpack(dstwr_msg_structure, data)
+        return MsgData(
+            buf[0].decode("utf-8"), buf[1].decode("utf-8"), *buf[2:10]
+        )
+    if struct.calcsize(dstwr_msg_structure_all) == len(data):
+        buf = struct.unpack(dstwr_msg_structure_all, data)
+        return MsgData(
+            msg_type=buf[0].decode("utf-8"),
+            state=buf[1].decode("utf-8"),
+            responder=buf[2],
+            sequence=buf[3],
+            measurement=buf[4],
+            distance=buf[5],
+            time_round_1=buf[6],
+            time_round_2=buf[7],
+            time_reply_1=buf[8],
+            time_reply_2=buf[9],
+            nlos=buf[13],
+            rssi=buf[10],
+            fpi=buf[11],
+        )
+    if struct.calcsize(simple_msg_sturcture) == len(data):
+        buf = struct.unpack(simple_msg_sturcture, data)
+        return SimpleMsgData(buf[0].decode("utf-8"), *buf[1:18])
+    raise ValueError(len(data))
+
+
+def main():
+    packets = {
+        "dstwr_msg_structure": decoder.DSTWR_MSG.layout.pack(
+            b"distance", b"running", 100, 1, 2, *range(5)
+        ),
+        "dstwr_msg_structure_all": decoder.DSTWR_MSG_ALL.layout.pack(
+            b"distance", b"running", 100, 1, 2, *range(7), 0, 1
+        ),
+        "simple_msg_sturcture": decoder.SIMPLE_MSG.layout.pack(
+            b"simple", 1, 2, *range(15), 0
+        ),
+    }
+    for name, data in packets.items():
+        assert legacy_decode(data) == decoder.decode(data)
+        before = timeit.timeit(
+            lambda data=data: legacy_decode(data), number=PACKETS
+        )
+        after = timeit.timeit(
+            lambda data=data: decoder.decode(data), number=PACKETS
+        )
+        print(
+            f"{name:<24} before: {PACKETS / before:>10,.0f} packets/s  "
+            f"after: {PACKETS / after:>10,.0f} packets/s  "
+            f"({before / after:.1f}x)"
+        )
+
+
+if __name__ == "__main__":
+    main()
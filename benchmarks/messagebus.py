@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+"""Benchmark of messages/sec through the bus built by bootstrap().
+
+Compares the previous MessageBus, a list queue and an isinstance chain
+per message, with the current one, both with the same injected
+handlers. The websocket is replaced by a sink, so the numbers cover
+dispatch, the handlers and JSON serialisation but no network.
+Run from the repository root: ``python -m benchmarks.messagebus``
+"""
+
+# Standard Library
+import asyncio
+import logging
+import time
+
+# Library
+from apps.sit_gateway import bootstrap
+from apps.sit_gateway.domain import commands, events
+from apps.sit_gateway.service_layer import uow
+
+
+MESSAGES = 100_000
+# Best of the repeats, to keep scheduler noise out of the comparison
+REPEATS = 5
+
+
+class LegacyMessageBus:  # pylint: disable=too-few-public-methods
+    """The message bus before the dispatch table, for the baseline."""
+
+    def __init__(self, event_handlers, command_handlers):
+        self.event_handlers = event_handlers
+        self.command_handlers = command_handlers
+        self.queue = []
+
+    async def handle(self, message):
+        self.queue = [message]
+        while self.queue:
+            message = self.queue.pop(0)
+            if isinstance(message, events.Event):
+                for handler in self.event_handlers[type(message)]:
+                    await handler(message)
+            elif isinstance(message, commands.Command):
+                await self.command_handlers[type(message)](message)
+            else:
+                raise TypeError(f"{message} was not an Event or Command")
+
+
+class SinkWebsocket:
+    """Counts the frames, same signatures as the Websocket methods."""
+
+    encoding = "json"
+
+    def __init__(self) -> None:
+        self.frames = 0
+
+    async def send(self, data_msg, trace=None):
+        del data_msg, trace
+        self.frames += 1
+
+    async def send_batch(self, frame_type, header, columns, trace=None):
+        del frame_type, header, columns, trace
+        self.frames += 1
+
+
+def distance_measurement(sequence: int) -> events.DistanceMeasurement:
+    return events.DistanceMeasurement(
+        initiator="SIT-Initiator",
+        responder="SIT-Responder",
+        sequence=sequence,
+        measurement_type="ds_3_twr",
+        measurement=sequence,
+        distance=1.5,
+        time_round_1=1.0,
+        time_round_2=2.0,
+        time_reply_1=3.0,
+        time_reply_2=4.0,
+        nlos=0,
+        rssi=-80.0,
+        fpi=-82.0,
+    )
+
+
+async def run(concurrent_events: bool | None) -> float:
+    """Messages per second, ``None`` runs the legacy bus."""
+    ws = SinkWebsocket()
+    bus = bootstrap.bootstrap(
+        uow.UnitOfWork(), ws, None, concurrent_events=bool(concurrent_events)
+    )
+    if concurrent_events is None:
+        bus = LegacyMessageBus(bus.event_handlers, bus.command_handlers)
+    messages = [distance_measurement(i) for i in range(MESSAGES)]
+    start = time.perf_counter()
+    for message in messages:
+        await bus.handle(message)
+    elapsed = time.perf_counter() - start
+    assert ws.frames == MESSAGES
+    return MESSAGES / elapsed
+
+
+def main():
+    # Measure the bus, not the console handler of the debug logging
+    logging.disable(logging.CRITICAL)
+    before = max(asyncio.run(run(None)) for _ in range(REPEATS))
+    print(f"{'before':<24} {before:>10,.0f} messages/s")
+    for concurrent_events in (False, True):
+        after = max(
+            asyncio.run(run(concurrent_events)) for _ in range(REPEATS)
+        )
+        print(
+            f"{f'concurrent_events={concurrent_events}':<24} "
+            f"{after:>10,.0f} messages/s  ({after / before:.2f}x)"
+        )
+
+
+if __name__ == "__main__":
+    main()
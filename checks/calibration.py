@@ -0,0 +1,198 @@
+#!/usr/bin/env python
+"""End to end check of a pair calibration through bootstrap().
+
+Three fake devices with known antenna delays answer the setup and
+start commands of the gateway and notify the distances a ranging
+between them measures. The calibration runs without the raw stream, so
+the solved delays are all the backend gets. The check fails unless
+they match the delays of the devices, and unless the setups of a
+following distance measurement and test configure the devices with
+them.
+Run from the repository root: ``python -m checks.calibration``
+"""
+
+# Standard Library
+import asyncio
+import json
+import logging
+import sys
+
+# Library
+from apps.sit_gateway import bootstrap
+from apps.sit_gateway.domain import commands
+from apps.sit_gateway.domain.calibration import ANT_DLY_UNIT, SPEED_OF_LIGHT
+from apps.sit_gateway.domain.data import MsgData
+from apps.sit_gateway.entrypoint import wire
+from apps.sit_gateway.gateway import SITGateway
+from apps.sit_gateway.service_layer import uow
+
+
+TRUE_DISTANCE = 2.0
+MEASUREMENTS = 10
+BASE_ANT_DLY = 16000
+# Antenna delay of every device, rx + tx in seconds
+DELAYS = {"SIT-1": 1.0e-9, "SIT-2": 0.5e-9, "SIT-3": 1.5e-9}
+# Tolerance of the solved delays, in antenna delay units
+TOLERANCE = 2
+
+
+class SinkWebsocket:
+    """Keeps the uplink frames instead of sending them."""
+
+    def __init__(self) -> None:
+        self.encoding = wire.JSON
+        self.frames: list[dict] = []
+
+    async def send(self, data_msg, trace=None):
+        del trace
+        self.frames.append(json.loads(data_msg))
+
+    async def send_direct(self, data_msg):
+        self.frames.append(json.loads(data_msg))
+
+    def frames_of(self, frame_type: str) -> list[dict]:
+        return [frame for frame in self.frames if frame["type"] == frame_type]
+
+
+class FakeDevice:
+    """Acks every setup, the responder of a round makes the initiator
+    notify the distances of the round once it is started."""
+
+    def __init__(self, name: str, gateway: SITGateway) -> None:
+        self.name = name
+        self.gateway = gateway
+        self.link = gateway.devices.intern(name)
+        self.setups: list[dict] = []
+        self.callback = None
+        self._tasks: set[asyncio.Task] = set()
+
+    def get_device_address(self) -> str:
+        return f"00:00:00:00:00:0{self.link}"
+
+    async def write_acked(self, uuid, message, **kwargs) -> bool:
+        del uuid, kwargs
+        self.setups.append(dict(message))
+        return True
+
+    async def write_message(self, uuid, message):
+        del uuid
+        setup = self.setups[-1] if self.setups else {}
+        if (
+            message.get("command") == "start"
+            and setup.get("device_type") == "responder"
+            and self.link in self.gateway.cali_active
+        ):
+            initiator = self.gateway.get_device(setup["initiator_device"])
+            task = asyncio.create_task(initiator.range_to(self.name))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def range_to(self, responder: str) -> None:
+        # the gateway enables the notify of the responder after its start
+        await asyncio.sleep(0.1)
+        distance = TRUE_DISTANCE + SPEED_OF_LIGHT / 2 * (
+            DELAYS[self.name] + DELAYS[responder]
+        )
+        for measurement in range(MEASUREMENTS):
+            data = MsgData(
+                "", "", 0, measurement, measurement, distance, 0, 0, 0, 0
+            )
+            await self.callback(data, self.link)
+
+    async def get_notification(self, uuid, callback) -> None:
+        del uuid
+        self.callback = callback
+
+    async def stop_notification(self, uuid) -> None:
+        del uuid
+
+    async def cleanup(self) -> None:
+        pass
+
+
+async def run_calibration(bus, ws: SinkWebsocket) -> dict:
+    await bus.handle(
+        commands.StartCalibrationMeasurement(
+            calibration_id=1,
+            devices=list(DELAYS),
+            max_measurement=MEASUREMENTS,
+            rx_ant_dly=BASE_ANT_DLY,
+            tx_ant_dly=BASE_ANT_DLY,
+            reference_distance=TRUE_DISTANCE,
+            raw_stream=False,
+        )
+    )
+    async with asyncio.timeout(30):
+        while not ws.frames_of("SaveAntennaDelayCalibration"):
+            await asyncio.sleep(0.1)
+    return ws.frames_of("SaveAntennaDelayCalibration")[0]["data"]
+
+
+def check_delays(solved: dict) -> list[str]:
+    errors = []
+    for name, delay in DELAYS.items():
+        expected = BASE_ANT_DLY + round(delay / 2 / ANT_DLY_UNIT)
+        for field in ("rx_ant_dly", "tx_ant_dly"):
+            value = solved["devices"][name][field]
+            if abs(value - expected) > TOLERANCE:
+                errors.append(f"{name} {field}: {value}, expected {expected}")
+    return errors
+
+
+def check_setups(gateway: SITGateway, solved: dict, setup: str) -> list:
+    """The last setup of every device has its solved delays."""
+    errors = []
+    for name in DELAYS:
+        message = gateway.get_device(name).setups[-1]
+        for field in ("rx_ant_dly", "tx_ant_dly"):
+            expected = solved["devices"][name][field]
+            if message.get(field) != expected:
+                errors.append(
+                    f"{setup} setup of {name} {field}: "
+                    f"{message.get(field)}, expected {expected}"
+                )
+    return errors
+
+
+async def main() -> int:
+    gateway = SITGateway()
+    ws = SinkWebsocket()
+    bus = bootstrap.bootstrap(uow.UnitOfWork(), ws, gateway)
+    gateway.bus = bus
+    for name in DELAYS:
+        device = FakeDevice(name, gateway)
+        gateway.devices.add(name, device.get_device_address(), device)
+
+    solved = await run_calibration(bus, ws)
+    errors = check_delays(solved)
+    if ws.frames_of("SimpleCalibrationMeasurement"):
+        errors.append("records were sent without the raw stream")
+
+    initiator, *responders = DELAYS
+    await bus.handle(
+        commands.StartDistanceMeasurement(
+            initiator=initiator, responder=responders
+        )
+    )
+    errors += check_setups(gateway, solved, "Measurement")
+    await bus.handle(commands.StopDistanceMeasurement())
+    await bus.handle(
+        commands.StartTestMeasurement(
+            test_id=1,
+            initiator=initiator,
+            responder=responders,
+            min_measurement=0,
+            max_measurement=MEASUREMENTS,
+        )
+    )
+    errors += check_setups(gateway, solved, "Test")
+    for error in errors:
+        print(f"FAIL {error}")
+    if not errors:
+        print(f"OK solved delays of {len(DELAYS)} devices")
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    logging.disable(logging.CRITICAL)
+    sys.exit(asyncio.run(main()))
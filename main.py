@@ -4,23 +4,85 @@
 import asyncio
 import logging
 import logging.config
+import os
 
 # Library
 from apps.sit_gateway import bootstrap
+from apps.sit_gateway.adapter.spool import Spool
 from apps.sit_gateway.entrypoint import websocket
+from apps.sit_gateway.entrypoint.metrics_http import MetricsServer
+from apps.sit_gateway.entrypoint.uplink import SPILL, UplinkQueue
 from apps.sit_gateway.gateway import SITGateway
 from apps.sit_gateway.service_layer import uow
+from apps.sit_gateway.service_layer.metrics import Metrics
 from apps.sit_gateway.service_layer.utils import cancel_task
 
 LOG_CONFIG_PATH = "settings/logging.conf"
+# Port of the local Prometheus metrics endpoint, e.g. 9108. The metrics
+# are off unless SIT_METRICS_PORT is set
+METRICS_PORT = (
+    int(os.environ["SIT_METRICS_PORT"])
+    if os.environ.get("SIT_METRICS_PORT")
+    else None
+)
+# What a full uplink queue does with new frames, block, drop_oldest or
+# spill. Spilled frames go to the spool, so the BLE callbacks never wait
+# on a stalled websocket
+UPLINK_OVERFLOW = os.environ.get("SIT_UPLINK_OVERFLOW", SPILL)
 
 # Load logging configuration
 logging.config.fileConfig(LOG_CONFIG_PATH)
 logger = logging.getLogger("main")
 
 gateway = SITGateway()
-ws = websocket.Websocket()
-bus = bootstrap.bootstrap(uow.UnitOfWork(), ws, gateway)
+spool = Spool("spool")
+ws = websocket.Websocket(
+    uplink=UplinkQueue(policy=UPLINK_OVERFLOW, spool=spool)
+)
+metrics = Metrics() if METRICS_PORT is not None else None
+bus = bootstrap.bootstrap(
+    uow.UnitOfWork("calibration.db"), ws, gateway, bus_metrics=metrics
+)
+if metrics is not None:
+    metrics.register_gauge(
+        "sit_uplink_queue_depth",
+        "Frames waiting for the websocket.",
+        lambda: ws.uplink.depth,
+    )
+    metrics.register_gauge(
+        "sit_uplink_frames_dropped_total",
+        "Frames dropped by the uplink overflow policy.",
+        lambda: ws.uplink.dropped,
+        kind="counter",
+    )
+    metrics.register_gauge(
+        "sit_uplink_frames_spilled_total",
+        "Frames written to the spool.",
+        lambda: ws.uplink.spilled,
+        kind="counter",
+    )
+    metrics.register_gauge(
+        "sit_spool_pending_bytes",
+        "Spooled bytes waiting for replay.",
+        lambda: spool.pending_bytes,
+    )
+    metrics.register_gauge(
+        "sit_bus_backlog_depth",
+        "Messages waiting for a message bus worker.",
+        lambda: bus.backlog_depth,
+    )
+    metrics.register_gauge(
+        "sit_exchanges_joined_total",
+        "Ranging exchanges joined from initiator and responder halves.",
+        lambda: gateway.joiner.joined,
+        kind="counter",
+    )
+    metrics.register_gauge(
+        "sit_exchange_fragments_unmatched_total",
+        "Exchange halves dropped without their other half.",
+        lambda: gateway.joiner.unmatched,
+        kind="counter",
+    )
 
 
 async def main():
@@ -33,6 +95,13 @@ async def main():
     async with asyncio.TaskGroup() as tg:
         gateway.set_dependencies(tg, bus)
         try:
+            tg.create_task(ws.run_sender(), name="Websocket Sender Task")
+            tg.create_task(ws.uplink.run_checkpoints(), name="Spool Task")
+            if metrics is not None:
+                tg.create_task(
+                    MetricsServer(metrics, port=METRICS_PORT).serve(),
+                    name="Metrics Task",
+                )
             task = tg.create_task(ws.connect(bus), name="Websocket Main Task")
             await task
         except KeyboardInterrupt:
@@ -43,7 +112,11 @@ async def main():
             logger.info("Disconnecting...")
             cancel_task("Notify Task")
             cancel_task("Websocket Main Task")
+            cancel_task("Websocket Sender Task")
+            cancel_task("Spool Task")
+            cancel_task("Metrics Task")
             await gateway.cleanup()
+            spool.close()
 
 
 if __name__ == "__main__":